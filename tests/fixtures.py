@@ -4,13 +4,30 @@ import tempfile
 
 
 class Fixtures(TestCase):
+    """
+    The db file & pager are created once per test class,
+    each test runs in a transaction which is rolled back afterwards.
+    """
+
     db_file_path: str
 
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.temp_dir = tempfile.TemporaryDirectory()
+        cls.db_file_path = cls.temp_dir.name + "/__testdb__.db"
+        cls.pager = Pager(cls.db_file_path)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.pager.close()
+        cls.temp_dir.cleanup()
+        super().tearDownClass()
+
     def setUp(self) -> None:
         super().setUp()
-        self.temp_dir = tempfile.TemporaryDirectory()
-        self.db_file_path = self.temp_dir.name + "/__testdb__.db"
-        self.pager = Pager(self.db_file_path)
+        self.pager.begin()
 
-    def cleanUp(self) -> None:
-        self.temp_dir.cleanup()
+    def tearDown(self) -> None:
+        self.pager.rollback()
+        super().tearDown()
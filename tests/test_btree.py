@@ -176,6 +176,24 @@ class TestBTree(Fixtures, TestCase):
         with self.assertRaises(StopIteration):
             next(cursor)
 
+    def test_cursor_advance(self):
+        cursor = BTree(self.pager, self.pager.new())
+        keys = list(range(200))
+
+        random.shuffle(keys)
+        for n in keys:
+            cursor.insert(self.create_record(n, f"hello-{n}"))
+
+        cursor.reset()
+        row_ids = []
+        record = cursor.advance()
+        while record is not None:
+            row_ids.append(record.row_id)
+            record = cursor.advance()
+
+        assert row_ids == sorted(keys)
+        assert cursor.advance() is None
+
     def test_cursor_seek(self):
         """
         Asserts we can seek to a specific key
@@ -189,6 +207,10 @@ class TestBTree(Fixtures, TestCase):
 
         keys.sort()
 
+        # Moving the cursor by seeking replaces the record next moved to.
+        assert next(iter(cursor)).row_id == 0
+        assert cursor.current().row_id == 0
+
         cursor.seek(7)
         record = cursor.current()
         assert record
@@ -249,3 +271,17 @@ class TestBTree(Fixtures, TestCase):
         assert record
         # Last row has key 9
         assert record.row_id == total - 1
+
+    def test_page_cache_sees_other_writers(self):
+        page_number = self.pager.new()
+        cursor = BTree(self.pager, page_number)
+        other_cursor = BTree(self.pager, page_number)
+
+        for n in range(10):
+            cursor.insert(self.create_record(n, f"hello-{n}"))
+            # Pages other_cursor has cached are stale after each insert.
+            record = other_cursor.find(n)
+            assert record
+            assert record.row_id == n
+
+        assert other_cursor.read_page.cache_info().hits > 0
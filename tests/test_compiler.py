@@ -1,10 +1,38 @@
-from toysql.compiler import Compiler, Instruction, Opcode, SCHEMA_TABLE_NAME
+from toysql.compiler import (
+    Compiler,
+    Instruction,
+    Opcode,
+    Program,
+    SCHEMA_TABLE_NAME,
+    check_jumps,
+    column_names_from_sql_text,
+    fuse_column_ranges,
+    parameterize,
+    parse_sql,
+    record_builder,
+)
+from toysql.lexer import DataType, lex
 from tests.fixtures import Fixtures
-from unittest.mock import Mock, patch
+from unittest.mock import patch
+import pickle
 
 # http://chi.cs.uchicago.edu/chidb/architecture.html#chidb-dbm
 
 
+class StubCompiler(Compiler):
+    """
+    Compiler with a fixed schema, cheaper than a Mock
+    for every get_schema call the compiler makes.
+    """
+
+    def __init__(self, pager, schema) -> None:
+        self.schema = schema
+        super().__init__(pager)
+
+    def get_schema(self):
+        return self.schema
+
+
 class TestCompiler(Fixtures):
     def setUp(self) -> None:
         super().setUp()
@@ -12,9 +40,9 @@ class TestCompiler(Fixtures):
             "CREATE TABLE products(code INTEGER PRIMARY KEY, name TEXT, price INTEGER)"
         )
         self.root_page_number = 2
-        self.compiler = Compiler(self.pager)
-        self.compiler.get_schema = Mock(
-            return_value=[
+        self.compiler = StubCompiler(
+            self.pager,
+            [
                 [
                     1,
                     "table",
@@ -23,7 +51,7 @@ class TestCompiler(Fixtures):
                     self.root_page_number,
                     self.sql_text,
                 ]
-            ]
+            ],
         )
 
     def tearDown(self) -> None:
@@ -100,7 +128,7 @@ class TestCompiler(Fixtures):
         String       8  3  _  "products"
         String       73 5  _  "CREATE TABLE products(code INTEGER PRIMARY KEY, name TEXT, price INTEGER)"
 
-        MakeRecord   1  5  6  _
+        MakeRecord   1  5  6  "tttit"
         Integer      1  7  _  _
 
         # Insert the new record
@@ -123,7 +151,7 @@ class TestCompiler(Fixtures):
             Instruction(Opcode.String, p1=8, p2=2, p4="products"),
             Instruction(Opcode.String, p1=8, p2=3, p4="products"),
             Instruction(Opcode.String, p1=len(sql_text), p2=5, p4=sql_text),
-            Instruction(Opcode.MakeRecord, p1=1, p2=5, p3=6),
+            Instruction(Opcode.MakeRecord, p1=1, p2=5, p3=6, p4="tttit"),
             Instruction(Opcode.Integer, p1=1, p2=7),
             Instruction(Opcode.Insert, p1=0, p2=6, p3=7),
             Instruction(Opcode.Close, p1=0),
@@ -150,7 +178,7 @@ class TestCompiler(Fixtures):
             # Instruction(Opcode.Null, p2=2), TODO: Not sure why Null is necessary here?
             Instruction(Opcode.Integer, p1=240, p2=2),
             Instruction(Opcode.Integer, p1=1, p2=3),
-            Instruction(Opcode.MakeRecord, p1=1, p2=3, p3=4),
+            Instruction(Opcode.MakeRecord, p1=1, p2=3, p3=4, p4="tii"),
             Instruction(Opcode.Insert, p1=0, p2=4, p3=3),
             Instruction(Opcode.Close, p1=0),
         ]
@@ -193,7 +221,308 @@ class TestCompiler(Fixtures):
             # Instruction(Opcode.Null, p2=2), TODO: Not sure why Null is necessary here?
             Instruction(Opcode.String, p1=10, p2=2, p4="Hard Drive"),
             Instruction(Opcode.Integer, p1=240, p2=3),
-            Instruction(Opcode.MakeRecord, p1=1, p2=3, p3=4),
+            Instruction(Opcode.MakeRecord, p1=1, p2=3, p3=4, p4="iti"),
             Instruction(Opcode.Insert, p1=0, p2=4, p3=1),
             Instruction(Opcode.Close, p1=0),
         ]
+
+    def test_parameterize(self):
+        assert parameterize("""INSERT INTO "t 5" VALUES (1, 'a''b', 7)""") == (
+            """INSERT INTO "t 5" VALUES (0, '', 0)""",
+            ["1", "a'b", "7"],
+        )
+
+    def test_pack(self):
+        program = self.compiler.compile(
+            """INSERT INTO products VALUES(1, 'Hard Drive', 240)"""
+        )
+        packed, pool = program.pack()
+
+        assert pool == ["Hard Drive", "iti"]
+        assert program.num_registers == 5
+        assert (
+            Program.unpack(packed, pool, program.num_registers).instructions
+            == program.instructions
+        )
+
+    def test_record_builder(self):
+        make_record = record_builder("iti")
+
+        assert make_record([None, 1, "Hard Drive", 240], 1) == [
+            [DataType.integer, 1],
+            [DataType.text, "Hard Drive"],
+            [DataType.integer, 240],
+        ]
+        assert record_builder("iti") is make_record
+
+    def test_to_bytes(self):
+        self.compiler.fuse = True
+        program = self.compiler._compile_template(
+            """INSERT INTO products VALUES(0, '', 0)""", 0, True
+        )
+        loaded = Program.from_bytes(program.to_bytes())
+
+        assert loaded.instructions == program.instructions
+        assert loaded.num_registers == program.num_registers
+        assert loaded.num_cursors == program.num_cursors == 1
+        assert [(loaded.instructions.index(ins), i) for ins, i in loaded.literals] == [
+            (program.instructions.index(ins), i) for ins, i in program.literals
+        ]
+
+        program = self.compiler.compile("select * from products;")
+        assert (
+            Program.from_bytes(program.to_bytes()).instructions == program.instructions
+        )
+
+    def test_pickle(self):
+        program = self.compiler.compile("select * from products;")
+        loaded = pickle.loads(pickle.dumps(program))
+
+        assert loaded.instructions == program.instructions
+        assert loaded.num_registers == program.num_registers
+        assert loaded.python is not None
+
+        program = self.compiler.compile(
+            """INSERT INTO products VALUES(1, 'Hard Drive', 240)"""
+        )
+        assert pickle.loads(pickle.dumps(program)).instructions == program.instructions
+
+    def test_program_cache(self):
+        schema = self.compiler.get_schema()
+        compiler = StubCompiler(self.pager, schema)
+        compiler.program_cache = True
+        program = compiler.compile(
+            """INSERT INTO products VALUES(1, 'Hard Drive', 240)"""
+        )
+
+        assert compiler.program_cache_path(
+            "INSERT INTO products VALUES(0, '', 0)"
+        ).exists()
+
+        # A fresh compiler, as if the process restarted, loads it from disk.
+        compiler = StubCompiler(self.pager, schema)
+        compiler.program_cache = True
+        with patch.object(compiler, "_compile") as _compile:
+            loaded = compiler.compile(
+                """INSERT INTO products VALUES(1, 'Hard Drive', 240)"""
+            )
+
+        _compile.assert_not_called()
+        assert loaded.instructions == program.instructions
+
+    def test_program_cache_unreadable(self):
+        schema = self.compiler.get_schema()
+        sql_text = """INSERT INTO products VALUES(1, 'Hard Drive', 240)"""
+        template = "INSERT INTO products VALUES(0, '', 0)"
+        path = self.compiler.program_cache_path(template)
+        program = self.compiler.compile(sql_text)
+        data = self.compiler._compile_template(template, 0, False).to_bytes()
+        # Another version's header, the same program truncated and garbage.
+        other_version = data[:4] + (2).to_bytes(4, "little") + data[8:]
+
+        for bad in [other_version, data[:7], data[:-3], b"\xff" * len(data)]:
+            path.parent.mkdir(exist_ok=True)
+            path.write_bytes(bad)
+
+            compiler = StubCompiler(self.pager, schema)
+            compiler.program_cache = True
+            loaded = compiler.compile(sql_text)
+
+            assert loaded.instructions == program.instructions
+            # The bad file was replaced with a good one.
+            assert path.read_bytes() == data
+
+    def test_select_fused(self):
+        self.compiler.fuse = True
+        program = self.compiler.compile("select * from products;")
+
+        assert program.instructions == [
+            Instruction(Opcode.Integer, p1=2, p2=0),
+            Instruction(Opcode.OpenRead, p1=0, p2=0, p3=4),
+            Instruction(Opcode.Rewind, p1=0, p2=5),
+            Instruction(Opcode.EmitRow, p1=0, p2=1, p3=3, p4=(0, 1, 2)),
+            Instruction(Opcode.Next, p1=0, p2=3),
+            Instruction(Opcode.Close, p1=0),
+            Instruction(Opcode.Halt, p1=0, p2=0),
+        ]
+
+    def test_insert_multiple_rows(self):
+        program = self.compiler.compile(
+            """INSERT INTO products VALUES(1, 'Hard Drive', 240), (2, 'SSD', 99)"""
+        )
+
+        assert program.instructions == [
+            Instruction(Opcode.Integer, p1=2, p2=0),
+            Instruction(Opcode.OpenWrite, p1=0, p2=0, p3=3),
+            Instruction(
+                Opcode.BulkInsert,
+                p1=0,
+                p2=0,
+                p4=((1, "Hard Drive", 240), (2, "SSD", 99)),
+            ),
+            Instruction(Opcode.Close, p1=0),
+        ]
+
+    def test_insert_wrong_number_of_values(self):
+        for sql_text in [
+            """INSERT INTO products VALUES(1, 'Hard Drive', 240), (2)""",
+            """INSERT INTO products VALUES(1), (2, 'SSD', 99)""",
+            """INSERT INTO products VALUES(1, 'Hard Drive', 240, 5)""",
+        ]:
+            with self.assertRaises(ValueError):
+                self.compiler.compile(sql_text)
+
+    def test_insert_multiple_rows_skips_caches(self):
+        # Loads the schema and caches the single row template.
+        self.compiler.compile("""INSERT INTO products VALUES(1, 'Hard Drive', 240)""")
+        lexed = lex.cache_info().currsize
+        parsed = parse_sql.cache_info().currsize
+
+        self.compiler.compile(
+            """INSERT INTO products VALUES(3, 'Keyboard', 30), (4, 'Mouse', 10)"""
+        )
+
+        assert self.compiler._template_cache.cache_info().currsize == 1
+        assert lex.cache_info().currsize == lexed
+        assert parse_sql.cache_info().currsize == parsed
+
+        # A "), (" in a string literal is still a single row.
+        program = self.compiler.compile(
+            """INSERT INTO products VALUES(5, 'Cable), (USB', 3)"""
+        )
+
+        assert self.compiler._template_cache.cache_info().hits == 1
+        assert program.instructions[3] == Instruction(
+            Opcode.String, p1=12, p2=2, p4="Cable), (USB"
+        )
+
+    def test_compile_cache(self):
+        """
+        Statements which only differ by their literals
+        reuse the same compiled template.
+        """
+        self.compiler.compile("""INSERT INTO products VALUES(1, 'Hard Drive', 240)""")
+        program = self.compiler.compile("""INSERT INTO products VALUES(2, 'SSD', 99)""")
+
+        assert self.compiler._template_cache.cache_info().hits == 1
+        assert program.instructions[2:5] == [
+            Instruction(Opcode.Integer, p1=2, p2=1),
+            Instruction(Opcode.String, p1=3, p2=2, p4="SSD"),
+            Instruction(Opcode.Integer, p1=99, p2=3),
+        ]
+
+    def test_prepare_statement(self):
+        sql_text = "select * from products;"
+        program = self.compiler.prepare_statement(sql_text)
+        assert self.compiler.prepare_statement(sql_text) is program
+
+        with patch.object(self.compiler, "get_schema", return_value=[]):
+            self.compiler.prepare_statement("CREATE TABLE users(id INTEGER, name TEXT)")
+
+        assert self.compiler.prepare_statement(sql_text) is not program
+
+    def test_schema_cache(self):
+        with patch.object(
+            self.compiler, "get_schema", wraps=self.compiler.get_schema
+        ) as get_schema:
+            self.compiler.compile("select * from products;")
+            self.compiler.compile(
+                """INSERT INTO products VALUES(1, 'Hard Drive', 240)"""
+            )
+
+        assert get_schema.call_count == 1
+
+    def test_column_cache(self):
+        with patch.object(
+            self.compiler,
+            "get_column_names_from_sql_text",
+            wraps=self.compiler.get_column_names_from_sql_text,
+        ) as get_column_names:
+            self.compiler.compile("select name from products;")
+            self.compiler.compile("select name, price from products;")
+
+        assert get_column_names.call_count == 1
+        assert self.compiler._column_index_cache == {
+            ("products", ("name",)): [1],
+            ("products", ("name", "price")): [1, 2],
+        }
+
+    def test_column_names_from_sql_text(self):
+        sql_text = "CREATE TABLE users(id INTEGER, name TEXT)"
+        names = column_names_from_sql_text(sql_text)
+
+        assert names == ("id", "name")
+        assert column_names_from_sql_text(sql_text) is names
+
+    def test_compile_cache_invalidated_by_create(self):
+        self.compiler.compile("select * from products;")
+
+        with patch.object(self.compiler, "get_schema", return_value=[]):
+            self.compiler.compile("CREATE TABLE users(id INTEGER, name TEXT)")
+
+        self.compiler.compile("select * from products;")
+        assert self.compiler._template_cache.cache_info().hits == 0
+
+    def test_compile_to_python(self):
+        program = self.compiler.compile("select * from products;")
+        assert program.python
+
+        program = self.compiler.compile(
+            """INSERT INTO products VALUES(1, 'Hard Drive', 240)"""
+        )
+        assert program.python is None
+
+    def test_fuse_column_ranges(self):
+        program = self.compiler.compile("select * from products;")
+
+        assert fuse_column_ranges(program.instructions) == [
+            Instruction(Opcode.Integer, p1=2, p2=0),
+            Instruction(Opcode.OpenRead, p1=0, p2=0, p3=4),
+            Instruction(Opcode.Rewind, p1=0, p2=7),
+            Instruction(Opcode.Key, p1=0, p2=1),
+            Instruction(Opcode.ColumnRange, p1=0, p2=1, p3=2, p4=2),
+            Instruction(Opcode.ResultRow, p1=1, p2=3),
+            Instruction(Opcode.Next, p1=0, p2=3),
+            Instruction(Opcode.Close, p1=0),
+            Instruction(Opcode.Halt, p1=0, p2=0),
+        ]
+
+        # The cached template's jumps are left alone.
+        program = self.compiler.compile("select * from products;")
+        assert program.instructions[2] == Instruction(Opcode.Rewind, p1=0, p2=8)
+        assert program.instructions[-3] == Instruction(Opcode.Next, p1=0, p2=3)
+
+    def test_fuse_cache_key(self):
+        self.compiler.compile("select * from products;")
+        self.compiler.fuse = True
+        program = self.compiler.compile("select * from products;")
+
+        assert Opcode.EmitRow in [i.op for i in program.instructions]
+
+    def test_parse_cache(self):
+        sql_text = "select name from products;"
+        [statement] = self.compiler.prepare(sql_text)
+        hits = parse_sql.cache_info().hits
+
+        assert self.compiler.prepare(sql_text)[0] is statement
+        assert parse_sql.cache_info().hits == hits + 1
+
+    def test_interned_instructions(self):
+        select = self.compiler.compile("select * from products;")
+        insert = self.compiler.compile(
+            """INSERT INTO products VALUES(1, 'Hard Drive', 240)"""
+        )
+
+        # Both end with the same Close.
+        assert select.instructions[-2] is insert.instructions[-1]
+
+    def test_check_jumps(self):
+        check_jumps(self.compiler.compile("select * from products;").instructions)
+
+        with self.assertRaises(AssertionError):
+            check_jumps(
+                [
+                    Instruction(Opcode.Rewind, p1=0, p2=2),
+                    Instruction(Opcode.Close, p1=0),
+                ]
+            )
@@ -19,6 +19,20 @@ from unittest import TestCase
 from toysql.exceptions import LexingException
 
 
+class TestCursor(TestCase):
+    def test_read(self):
+        cursor = Cursor("select\n  x")
+
+        assert cursor.peek(6) == "select"
+        assert cursor.pointer == 0
+        assert cursor.read(8) == "select\n "
+        assert cursor.location() == Location(1, 1)
+        assert cursor.read(10) == " x"
+        assert cursor.is_complete()
+        assert cursor.location(0) == Location(0, 0)
+        assert cursor.location(9) == Location(1, 2)
+
+
 class TestSymbolLexer(TestCase):
     def test_lex(self):
         cases = [(",b", ",", 1), ("*", "*", 1), (" *", None, 0), ("select", None, 0)]
@@ -41,6 +55,7 @@ class TestNumericLexer(TestCase):
             ("123 ", "123", 3),
             (" 123", None, 0),
             ("1.11 ", "1.11", 4),
+            ("1e-5,", "1e-5", 4),
             ("select", None, 0),
         ]
 
@@ -62,6 +77,10 @@ class TestKeywordLexer(TestCase):
             (" select", None),
             ("hello", None),
             ("from tablename", "from"),
+            ("SELECT", "select"),
+            ("intotable", None),
+            ("into table", "into"),
+            ("key", "key"),
         ]
 
         for source, value in cases:
@@ -76,7 +95,13 @@ class TestKeywordLexer(TestCase):
 
 class TestStringLexer(TestCase):
     def test_lex(self):
-        cases = [("'abc'", "abc", 5), (" 'abc'", None, 0), ("select", None, 0)]
+        cases = [
+            ("'abc'", "abc", 5),
+            (" 'abc'", None, 0),
+            ("select", None, 0),
+            ("'it''s' x", "it's", 7),
+            ("'abc", None, 4),
+        ]
 
         for source, value, index in cases:
             cursor = Cursor(source)
@@ -111,6 +136,11 @@ class TestStatementLexer(TestCase):
     def get_token_by_kind(tokens: List[Token], kind: Kind):
         return (token for token in tokens if token.kind == kind)
 
+    def test_lex_cache(self):
+        query = "select * from my_table;"
+
+        assert lex(query) is lex(query)
+
     def test_select_x(self):
         query = """select * from "my_table"\nwhere x = 'hi'\nand y = 123;"""
 
@@ -132,7 +162,7 @@ class TestStatementLexer(TestCase):
             Token(Symbol.semicolon, loc=Location(2, 11)),
         ]
 
-        assert tokens == expected_tokens
+        assert tokens == tuple(expected_tokens)
 
     def test_select_multi_columns(self):
         query = """select x,y from "my_table"\nwhere x = 'hi'\nand y = 123;"""
@@ -157,7 +187,7 @@ class TestStatementLexer(TestCase):
             Token(Symbol.semicolon, loc=Location(2, 11)),
         ]
 
-        assert tokens == expected_tokens
+        assert tokens == tuple(expected_tokens)
 
     def test_create_table(self):
         query = """CREATE TABLE u (id INTEGER, name TEXT)"""
@@ -177,7 +207,7 @@ class TestStatementLexer(TestCase):
             Token(Symbol.right_paren, loc=Location(0, 37)),
         ]
 
-        assert tokens == expected_tokens
+        assert tokens == tuple(expected_tokens)
 
     def test_create_table_with_pk(self):
         query = """CREATE TABLE u (id INTEGER PRIMARY KEY, name TEXT)"""
@@ -199,7 +229,7 @@ class TestStatementLexer(TestCase):
             Token(Symbol.right_paren, loc=Location(0, 49)),
         ]
 
-        assert tokens == expected_tokens
+        assert tokens == tuple(expected_tokens)
 
     def test_insert(self):
         query = """INSERT INTO users VALUES (1, 'Phil');"""
@@ -219,7 +249,7 @@ class TestStatementLexer(TestCase):
             Token(Symbol.semicolon, loc=Location(0, 36)),
         ]
 
-        assert tokens == expected_tokens
+        assert tokens == tuple(expected_tokens)
 
     def test_invalid_sql_symbol(self):
         query = """INSERT $$"""
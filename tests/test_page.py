@@ -29,6 +29,16 @@ class TestCell(TestCase):
         new_cell = LeafPageCell.from_bytes(raw_bytes)
         assert new_cell.record.values == payload
 
+    def test_leaf_page_cell_decodes_record_lazily(self):
+        payload = [[DataType.integer, 3], [DataType.text, "Craig"]]
+        raw_bytes = LeafPageCell(Record(payload)).to_bytes()
+        new_cell = LeafPageCell.from_bytes(raw_bytes)
+
+        assert new_cell.row_id == 3
+        assert new_cell._record is None
+        assert new_cell.to_bytes() == raw_bytes
+        assert new_cell.record.values == payload
+
     def test_interior_page_cell(self):
         cell = InteriorPageCell(3, 12)
         raw_bytes = cell.to_bytes()
@@ -61,6 +71,14 @@ class TestPage(TestCase):
         for i, cell in enumerate(new_leaf_page.cells):
             assert cell == leaf_page.cells[i]
 
+    def test_leaf_cell_equality(self):
+        cell = LeafPageCell(Record([[DataType.integer, 1], [DataType.text, "a"]]))
+        other = LeafPageCell(Record([[DataType.integer, 1], [DataType.text, "zzz"]]))
+
+        assert cell == LeafPageCell.from_bytes(cell.to_bytes())
+        assert cell != other
+        assert cell != LeafPageCell.from_bytes(other.to_bytes())
+
     def test_interior_page(self):
         """
         Bug where only adding one cell caused issues.
@@ -91,3 +109,26 @@ class TestPage(TestCase):
             cells.append(leaf_page.add(payload))
 
         assert sorted(cells) == leaf_page.cells
+
+    def test_page_keys(self):
+        interior_page = Page(PageType.interior, 2, right_child_page_number=3)
+
+        for n in [5, 3, 1, 3]:
+            interior_page.add_cell(InteriorPageCell(n, n + 1))
+
+        assert list(interior_page.keys) == [1, 3, 5]
+
+        interior_page.remove_cell(InteriorPageCell(3, 4))
+        assert list(interior_page.keys) == [1, 5]
+
+    def test_find_cell(self):
+        leaf_page = Page(PageType.leaf, 2)
+
+        for n in [5, 3, 1]:
+            leaf_page.add([[DataType.integer, n], [DataType.text, f"name-{n}"]])
+
+        page = Page.from_bytes(leaf_page.to_bytes())
+        cell = page.find_cell(3)
+        assert cell and cell.record.values[1] == [DataType.text, "name-3"]
+        assert page.find_cell(4) is None
+        assert page.find_cell(6) is None
@@ -1,5 +1,6 @@
 from snapshottest import TestCase
 from toysql.pager import Pager
+from toysql.record import DataType
 from tests.fixtures import Fixtures
 
 
@@ -15,3 +16,22 @@ class TestPager(Fixtures, TestCase):
 
         with self.assertRaises(Exception):
             Pager(self.db_file_path)
+
+    def test_rollback(self):
+        pager = Pager(self.temp_dir.name + "/__rollback__.db")
+        page_number = pager.new()
+        page = pager.read(page_number)
+
+        pager.begin()
+        page.add([[DataType.integer, 3]])
+        pager.write(page)
+        pager.new()
+
+        assert len(pager) == 2
+        assert len(pager.read(page_number).cells) == 1
+
+        pager.rollback()
+
+        assert len(pager) == 1
+        assert len(pager.read(page_number).cells) == 0
+        pager.close()
@@ -124,6 +124,30 @@ class TestInsertParser(TestCase):
         assert stmt.values == [tokens[5], tokens[7]]
         assert stmt.into == tokens[2]
 
+    def test_insert_multiple_rows(self):
+        tokens = [
+            Token(Keyword.insert),
+            Token(Keyword.into),
+            Token(Identifier.long, value="users"),
+            Token(Keyword.values),
+            Token(Symbol.left_paren),
+            Token(DataType.integer, value="1"),
+            Token(Symbol.comma),
+            Token(DataType.text, value="Phil"),
+            Token(Symbol.right_paren),
+            Token(Symbol.comma),
+            Token(Symbol.left_paren),
+            Token(DataType.integer, value="2"),
+            Token(Symbol.comma),
+            Token(DataType.text, value="Jill"),
+            Token(Symbol.right_paren),
+            Token(Symbol.semicolon),
+        ]
+        cursor = TokenCursor(tokens)
+        stmt = InsertStatement.parse(cursor)
+        assert stmt.values == [tokens[5], tokens[7]]
+        assert stmt.rows == [[tokens[5], tokens[7]], [tokens[11], tokens[13]]]
+
 
 class TestSelectParser(TestCase):
     def test_select_astrix(self):
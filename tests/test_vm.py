@@ -1,7 +1,15 @@
 import unittest
 from toysql.vm import VM
 from tests.fixtures import Fixtures
-from toysql.compiler import Compiler, SCHEMA_TABLE_NAME
+from toysql.compiler import (
+    Compiler,
+    Instruction,
+    Opcode,
+    Program,
+    SCHEMA_TABLE_NAME,
+    fuse_column_ranges,
+)
+from toysql.lexer import DataType
 import random
 
 
@@ -57,6 +65,74 @@ class TestVM(Fixtures):
         for i, record in enumerate(records):
             assert record[0] == rows[i][0]
 
+    def test_insert_escaped_quote(self):
+        self.execute(f"INSERT INTO {self.table_name} VALUES (1, 'o''neil', 'o@x.com');")
+        self.execute(f"INSERT INTO {self.table_name} VALUES (2, 'bob', 'b@x.com');")
+
+        [first, second] = self.execute(f"SELECT * FROM {self.table_name}")
+        # TODO: Listing key here twice.
+        assert first[2] == "o'neil"
+        assert second[2] == "bob"
+
+    def test_make_record_infers_types(self):
+        # Without p4 MakeRecord works out each column's type from it's value.
+        program = Program(
+            [],
+            [
+                Instruction(Opcode.Integer, p1=1, p2=0),
+                Instruction(Opcode.String, p1=1, p2=1, p4="a"),
+                Instruction(Opcode.MakeRecord, p1=0, p2=2, p3=2),
+                Instruction(Opcode.ResultRow, p1=2, p2=2),
+                Instruction(Opcode.Halt),
+            ],
+            num_registers=3,
+        )
+
+        assert list(self.vm.execute(program)) == [
+            [[[DataType.integer, 1], [DataType.text, "a"]]]
+        ]
+
+    def test_seek_rowid(self):
+        for n in range(1, 50):
+            self.execute(
+                f"INSERT INTO {self.table_name} VALUES ({n}, 'user-{n}', 'x');"
+            )
+
+        root_page_number = self.compiler.get_table_root_page_number(self.table_name)
+
+        def seek(row_id):
+            program = Program(
+                [],
+                [
+                    Instruction(Opcode.Integer, p1=root_page_number, p2=0),
+                    Instruction(Opcode.OpenRead, p1=0, p2=0),
+                    Instruction(Opcode.Integer, p1=row_id, p2=1),
+                    Instruction(Opcode.SeekRowid, p1=0, p2=6, p3=1),
+                    Instruction(Opcode.Column, p1=0, p2=2, p3=2),
+                    Instruction(Opcode.ResultRow, p1=2, p2=2),
+                    Instruction(Opcode.Close, p1=0),
+                    Instruction(Opcode.Halt),
+                ],
+                num_registers=3,
+                num_cursors=1,
+            )
+            return list(self.vm.execute(program))
+
+        assert seek(37) == [["user-37"]]
+        assert seek(100) == []
+
+    def test_quoted_table_names_with_digits(self):
+        # Digits in quoted identifiers aren't literals, "t 5" mustn't be
+        # compiled as the template for "t 0".
+        self.execute('CREATE TABLE "t 5" (id INTEGER, name TEXT);')
+        self.execute("""INSERT INTO "t 5" VALUES (5, 'five');""")
+        assert self.execute('SELECT * FROM "t 5"') == [[5, 5]]
+
+        self.execute('CREATE TABLE "t 0" (id INTEGER, name TEXT);')
+        self.execute("""INSERT INTO "t 0" VALUES (1, 'zero');""")
+        assert self.execute('SELECT * FROM "t 0"') == [[1, 1]]
+        assert self.execute('SELECT * FROM "t 5"') == [[5, 5]]
+
     def test_insert_and_select_many(self):
         keys = [k for k in range(100)]
         rows = []
@@ -78,6 +154,88 @@ class TestVM(Fixtures):
         for i, record in enumerate(records):
             assert record[0] == keys[i]
 
+    def test_insert_and_select_fused(self):
+        rows = [
+            [1, "fred", "fred@flintstone.com"],
+            [2, "pebbles", "pebbles@flintstone.com"],
+        ]
+
+        for row in rows:
+            self.execute(
+                f"INSERT INTO {self.table_name} VALUES ({row[0]}, '{row[1]}', '{row[2]}');"
+            )
+
+        records = self.execute(f"SELECT * FROM {self.table_name}")
+
+        compiler = Compiler(self.pager, fuse=True)
+        program = compiler.compile(f"SELECT * FROM {self.table_name}")
+        opcodes = [instruction.op for instruction in program.instructions]
+        assert Opcode.EmitRow in opcodes
+
+        # Run the superinstructions themselves rather than the python version.
+        program.python = None
+        fused_records = [row for row in self.vm.execute(program)]
+
+        assert len(fused_records) == len(rows)
+        assert fused_records == records
+
+    def test_select_column_range(self):
+        self.execute(
+            f"INSERT INTO {self.table_name} VALUES (1, 'fred', 'fred@flintstone.com');"
+        )
+        records = self.execute(f"SELECT * FROM {self.table_name}")
+
+        program = self.compiler.compile(f"SELECT * FROM {self.table_name}")
+        program.python = None
+        program.instructions = fuse_column_ranges(program.instructions)
+
+        assert [row for row in self.vm.execute(program)] == records
+
+    def test_bulk_insert_wrong_number_of_values(self):
+        with self.assertRaises(ValueError):
+            self.execute(
+                f"INSERT INTO {self.table_name} VALUES (1, 'fred', 'fred@flintstone.com'), (2, 'pebbles');"
+            )
+
+        # Nothing was inserted before the bad row was found.
+        assert self.execute(f"SELECT * FROM {self.table_name}") == []
+
+    def test_bulk_insert(self):
+        rows = [
+            [1, "fred", "fred@flintstone.com"],
+            [2, "pebbles", "pebbles@flintstone.com"],
+        ]
+        values = ", ".join(f"({row[0]}, '{row[1]}', '{row[2]}')" for row in rows)
+        self.execute(f"INSERT INTO {self.table_name} VALUES {values};")
+        bulk_records = self.execute(f"SELECT * FROM {self.table_name}")
+
+        # Same rows one insert at a time in a second table.
+        self.execute("CREATE TABLE friends (id INTEGER, name TEXT, email TEXT);")
+        for row in rows:
+            self.execute(
+                f"INSERT INTO friends VALUES ({row[0]}, '{row[1]}', '{row[2]}');"
+            )
+        records = self.execute("SELECT * FROM friends")
+
+        assert len(bulk_records) == len(rows)
+        assert bulk_records == records
+
+    def test_select_compiled_to_python(self):
+        for key in range(3):
+            self.execute(
+                f"INSERT INTO {self.table_name} VALUES ({key}, 'name-{key}', '{key}@flintstone.com');"
+            )
+
+        program = self.compiler.compile(f"SELECT * FROM {self.table_name}")
+        assert program.python
+
+        records = [row for row in self.vm.execute(program)]
+        program.python = None
+        interpreted = [row for row in self.vm.execute(program)]
+
+        assert len(records) == 3
+        assert records == interpreted
+
     @unittest.skip("TODO: No duplicate checking.")
     def test_vm_duplicate_key(self):
         row = (1, "fred", "fred@flintstone.com")
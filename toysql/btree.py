@@ -1,13 +1,18 @@
 from toysql.page import PageType, LeafPageCell, Page, InteriorPageCell
 from toysql.record import Record
 from toysql.exceptions import NotFoundException
-from typing import Optional
+from typing import Optional, Tuple
 from dataclasses import dataclass
+from functools import lru_cache
+import bisect
 import sys
 
 
 @dataclass
 class Frame:
+    # One is allocated per level on every descent.
+    __slots__ = ("page_number", "child_index")
+
     page_number: int
     child_index: int
 
@@ -39,21 +44,38 @@ class BTree:
     def __init__(self, pager, root_page_number) -> None:
         self.pager = pager
         self.root_page_number = root_page_number
+        # Decoded pages, so the upper levels are only read once
+        # across repeated descents.
+        self.read_page = lru_cache(maxsize=64)(pager.read)
+        self.generation = pager.generation
         self.reset()
 
+    def read(self, page_number) -> Page:
+        if self.generation != self.pager.generation:
+            # The file changed since the pages were cached.
+            self.read_page.cache_clear()
+            self.generation = self.pager.generation
+
+        return self.read_page(page_number)
+
     @property
     def root(self) -> Page:
-        return self.pager.read(self.root_page_number)
+        return self.read(self.root_page_number)
 
     def new_page(self, page_type) -> Page:
         page_number = self.pager.new()
         return Page(page_type, page_number)
 
     def show(self):
-        return self.root.show(0, self.pager.read)
+        return self.root.show(0, self.read)
 
     def reset(self):
-        self.stack = [Frame(self.root.page_number, 0)]
+        # The root page number never changes (splits swap page numbers)
+        # so there's no need to read the root page here.
+        self.stack = [Frame(self.root_page_number, 0)]
+        # The record __next__ last moved to, current() hands it out
+        # directly rather than finding it on the page again.
+        self.record = None
         # rewind = True tells us that the cursor
         # has not moved yet
         # TODO: Better way to do this?
@@ -74,15 +96,10 @@ class BTree:
         """
         cell = LeafPageCell(record)
 
-        try:
-            self.seek(record.row_id)
-        except NotFoundException:
-            pass
-
-        # Get current position
-        frame = self.stack[-1]
-
-        page = self.pager.read(frame.page_number)
+        # The stack is left holding the path to the leaf
+        # so splits can walk back up through the parents.
+        self.reset()
+        page, _ = self._descend(record.row_id)
         page.add_cell(cell)
 
         if page.is_full():
@@ -121,7 +138,7 @@ class BTree:
             self.stack.append(Frame(parent.page_number, 0))
         else:
             frame = self.stack[-1]
-            parent = self.pager.read(frame.page_number)
+            parent = self.read(frame.page_number)
 
         parent.add_cell(InteriorPageCell(key, left.page_number))
 
@@ -144,9 +161,8 @@ class BTree:
 
         left = self.new_page(PageType.interior)
         left.cells = page.cells[:index]
-        page.cells = page.cells[index:]
-
-        middle = page.cells.pop(0)
+        middle = page.cells[index]
+        page.cells = page.cells[index + 1 :]
         left.right_child_page_number = middle.left_child_page_number
 
         parent = page.parent
@@ -161,7 +177,7 @@ class BTree:
             self.stack.append(Frame(parent.page_number, 0))
         else:
             frame = self.stack[-1]
-            parent = self.pager.read(frame.page_number)
+            parent = self.read(frame.page_number)
 
         parent.add_cell(InteriorPageCell(middle.row_id, left.page_number))
 
@@ -188,7 +204,7 @@ class BTree:
         """
         Returns true if the root page is empty.
         """
-        root_page = self.pager.read(self.root_page_number)
+        root_page = self.read(self.root_page_number)
         return len(root_page.cells) == 0
 
     def find(self, row_id: int) -> Optional[Record]:
@@ -213,43 +229,64 @@ class BTree:
 
         it'll set the cursor to point at the insert location.
         """
+        page, found = self._descend(row_id)
+
+        if not found and len(page.cells) > 0:
+            raise NotFoundException(f"Couldn't seek to row {row_id}")
+
+    def _descend(self, row_id: int) -> Tuple[Page, bool]:
+        """
+        Walks down from the current frame to the leaf page
+        where row_id is or would be inserted, pushing a frame
+        for each page on the way.
+
+        Returns the leaf page and whether row_id was found.
+        """
         self.rewind = False
+        self.record = None
+        stack = self.stack
 
-        if len(self.stack) == 0:
+        if len(stack) == 0:
             raise StopIteration()
 
-        frame = self.stack[-1]
-        current_page = self.pager.read(frame.page_number)
+        # Looked up once rather than on every level.
+        read = self.read
+        bisect_left = bisect.bisect_left
+        bisect_right = bisect.bisect_right
+        leaf = PageType.leaf
+        frame = stack[-1]
 
-        if current_page.is_leaf():
-            for cell in current_page.cells:
-                frame.child_index += 1
+        while True:
+            current_page = read(frame.page_number)
+            keys = current_page.keys
+            size = len(keys)
 
-                if row_id == cell.row_id:
-                    return
+            if current_page.page_type is leaf:
+                i = bisect_left(keys, row_id)
+
+                if i < size and keys[i] == row_id:
+                    # child_index points one past the current cell.
+                    frame.child_index = i + 1
+                    return current_page, True
+
+                frame.child_index = size
+                return current_page, False
 
-                if frame.child_index == len(current_page.cells):
-                    raise NotFoundException(f"Couldn't seek to row {row_id}")
-        else:
             # InteriorPage
-            # Here we keep track of each branch we have been down
-            # in the stack. If we have already been down a child branch
-            # we skip it.
-            # If we have been down all child paths we pop off the stack
-            # and traverse the parent.
-            for cell in current_page.cells:
-                if row_id < cell.row_id:
-                    # found branch to follow
-                    self.stack.append(Frame(cell.left_child_page_number, 0))
-                    return self._seek(row_id)
-                else:
-                    frame.child_index += 1
+            # Follow the first branch whose key is greater than row_id,
+            # the child_index records which branch we went down.
+            # If there isn't one take the right most child.
+            i = bisect_right(keys, row_id)
+            frame.child_index = i
+
+            if i < size:
+                page_number = current_page.cells[i].left_child_page_number
+            else:
+                page_number = current_page.right_child_page_number
+                assert page_number
 
-            # Didn't find branch take right most child
-            # Follow the right most branch
-            assert current_page.right_child_page_number
-            self.stack.append(Frame(current_page.right_child_page_number, 0))
-            return self._seek(row_id)
+            frame = Frame(page_number, 0)
+            stack.append(frame)
 
     def current(self) -> Record:
         """
@@ -262,8 +299,11 @@ class BTree:
             # on a cursor which hasn't moved.
             return self.__next__()
 
+        if self.record is not None:
+            return self.record
+
         frame = self.stack[-1]
-        current_page = self.pager.read(frame.page_number)
+        current_page = self.read(frame.page_number)
 
         if current_page.is_leaf():
             if len(current_page.cells) == 0:
@@ -279,52 +319,59 @@ class BTree:
         else:
             return self.__next__()
 
-    def __next__(self):
-        self.rewind = False
-        if len(self.stack) == 0:
+    def __next__(self) -> Record:
+        record = self.advance()
+        if record is None:
             raise StopIteration()
 
-        frame = self.stack[-1]
-        current_page = self.pager.read(frame.page_number)
+        return record
+
+    def advance(self) -> Optional[Record]:
+        """
+        Moves the cursor to the next record and returns it, or None
+        once there are no more. Same as next() without the StopIteration,
+        so scans don't pay for raising one.
+        """
+        self.rewind = False
+        stack = self.stack
+        read = self.read
+
+        while stack:
+            frame = stack[-1]
+            current_page = read(frame.page_number)
+            cells = current_page.cells
+            i = frame.child_index
+
+            if current_page.is_leaf():
+                if i < len(cells):
+                    frame.child_index += 1
+                    self.record = cells[i].record
+                    return self.record
 
-        if current_page.is_leaf():
-            try:
-                v = current_page.cells[frame.child_index]
-                frame.child_index += 1
-                return v.record
-            except IndexError:
                 # End of the LeafPage
                 # Walk back up to parent.
-                self.stack.pop()
-                return self.__next__()
+                stack.pop()
+                continue
 
-        else:
             # InteriorPage
             # Here we keep track of each branch we have been down
-            # in the stack. If we have already been down a child branch
-            # we skip it.
+            # in the stack. child_index is the next branch to go down,
+            # the cells left children and then the right most child.
             # If we have been down all child paths we pop off the stack
             # and traverse the parent.
-            for i, page_number in enumerate(self.child_page_numbers(current_page)):
-                if not isinstance(page_number, int):
-                    raise Exception("page_number not int")
-
-                # Find the branch we haven't been down yet.
-                if i < frame.child_index:
-                    continue
-                else:
-                    frame.child_index += 1
-                    self.stack.append(Frame(page_number, 0))
-                    return self.__next__()
-
-            # We have exhausted all child branches
-            # Pop off back up to parent.
-            self.stack.pop()
-            return self.__next__()
-
-    @staticmethod
-    def child_page_numbers(page):
-        for cell in page.cells:
-            yield cell.left_child_page_number
-
-        yield page.right_child_page_number
+            if i < len(cells):
+                page_number = cells[i].left_child_page_number
+            elif i == len(cells):
+                page_number = current_page.right_child_page_number
+            else:
+                stack.pop()
+                continue
+
+            if not isinstance(page_number, int):
+                raise Exception("page_number not int")
+
+            frame.child_index += 1
+            stack.append(Frame(page_number, 0))
+
+        self.record = None
+        return None
@@ -1,4 +1,12 @@
-from typing import List, Any, Optional, Union
+from typing import List, Any, Dict, Optional, Union, Tuple, Callable, cast
+from array import array
+from functools import lru_cache
+from ast import literal_eval
+from pathlib import Path
+import hashlib
+import os
+import re
+import struct
 from toysql.pager import Pager
 from toysql.parser import (
     SelectStatement,
@@ -6,13 +14,12 @@ from toysql.parser import (
     CreateStatement,
     parse,
 )
-from toysql.lexer import lex, DataType
-from enum import Enum, auto
-from dataclasses import dataclass
-from toysql.exceptions import TableFoundException
+from toysql.lexer import lex, tokenize, DataType
+from enum import IntEnum
+from dataclasses import dataclass, field
+from toysql.exceptions import ProgramVersionException, TableFoundException
 from toysql.btree import BTree
 
-
 """
 All opcodes can be found here: https://www.sqlite.org/opcode.html
 This is a subset of them implemented for toysqls feature set.
@@ -20,69 +27,120 @@ This is a subset of them implemented for toysqls feature set.
 # http://chi.cs.uchicago.edu/chidb/architecture.html#chidb-dbm
 
 
-class Opcode(Enum):
+class Opcode(IntEnum):
+    # The values are pinned rather than auto() since they're what gets
+    # serialized in Program.to_bytes, only ever append new opcodes.
+    # What each opcode does with it's operands is in docs/opcodes.md.
     # Register Manipulation Instructions
-    Integer = auto()
-    String = auto()
-    Null = auto()
-    SCopy = auto()
+    Integer = 1
+    String = 2
+    Null = 3
+    SCopy = 4
 
     # Control Flow Instructions
-    Eq = auto()
-    Ne = auto()
-    Lt = auto()
-    Le = auto()
-    Gt = auto()
-    Ge = auto()
-    Halt = auto()
-    Noop = auto()
+    Eq = 5
+    Ne = 6
+    Lt = 7
+    Le = 8
+    Gt = 9
+    Ge = 10
+    Halt = 11
+    Noop = 12
 
     # Database Opening and Closing Instructions
-    OpenRead = auto()
-    OpenWrite = auto()
-    Close = auto()
+    OpenRead = 13
+    OpenWrite = 14
+    Close = 15
 
     # Cursor Manipulation Instructions
-    Rewind = auto()
-    Next = auto()
-    Prev = auto()
-    Seek = auto()
-    SeekGt = auto()
-    SeekGe = auto()
-    SeekLt = auto()
-    IdxGt = auto()
-    IdxLt = auto()
-    IdxLe = auto()
+    Rewind = 16
+    Next = 17
+    Prev = 18
+    Seek = 19
+    SeekGt = 20
+    SeekGe = 21
+    SeekLt = 22
+    IdxGt = 23
+    IdxLt = 24
+    IdxLe = 25
 
     # Cursor Access Instructions
-    Column = auto()
-    Key = auto()
-    IdxPKey = auto()
+    Column = 26
+    Key = 27
+    IdxPKey = 28
 
     # Database Record Instructions
-    MakeRecord = auto()
-    ResultRow = auto()
+    MakeRecord = 29
+    ResultRow = 30
 
     # Insert instructions
-    Insert = auto()
-    IdxInsert = auto()
+    Insert = 31
+    IdxInsert = 32
 
     # B-Tree Creation Instructions
-    CreateTable = auto()
-    CreateIndex = auto()
+    CreateTable = 33
+    CreateIndex = 34
+
+    # Superinstructions
+    # EmitRow is only emitted when the compiler fuses a program.
+    EmitRow = 35
+    BulkInsert = 36
+    ColumnRange = 37
+
+    # Cursor Manipulation, appended so the values above stay the same.
+    SeekRowid = 38
 
 
-@dataclass
 class InstructionIR:
-    opcode: Opcode
-    p1: Union[int, "InstructionIR"] = 0
-    p2: Union[int, "InstructionIR"] = 0
-    p3: Union[int, "InstructionIR"] = 0
-    p4: Optional[Union[str, int, "InstructionIR"]] = None  # TODO narrow type
-    p5: int = 0
+    """
+    An instruction as the compiler emits it, operands can still
+    point at other InstructionIRs until Program.compile lowers them.
+
+    A handful of these are allocated per statement compiled so
+    they use __slots__ like Instruction does.
+    """
+
+    __slots__ = ("opcode", "p1", "p2", "p3", "p4", "p5")
+
+    def __init__(
+        self,
+        opcode: Opcode,
+        p1: Union[int, "InstructionIR"] = 0,
+        p2: Union[int, "InstructionIR"] = 0,
+        p3: Union[int, "InstructionIR"] = 0,
+        # A tuple for EmitRow's columns or BulkInsert's rows.
+        p4: Optional[Union[str, int, Tuple[Any, ...], "InstructionIR"]] = None,
+        p5: int = 0,
+    ):
+        self.opcode = opcode
+        self.p1 = p1
+        self.p2 = p2
+        self.p3 = p3
+        self.p4 = p4
+        self.p5 = p5
+
+    def __repr__(self) -> str:
+        return (
+            f"InstructionIR({self.opcode.name}, p1={self.p1}, p2={self.p2}, "
+            f"p3={self.p3}, p4={self.p4!r}, p5={self.p5})"
+        )
+
+
+def load_integer(value: int, addr: int) -> InstructionIR:
+    """
+    Integer storing value in register addr.
+    """
+    return InstructionIR(Opcode.Integer, p1=value, p2=addr)
+
+
+def load_string(text: str, addr: int) -> InstructionIR:
+    """
+    String storing text in register addr, p1 being it's length
+    is worked out here once rather than at every call site.
+    """
+    return InstructionIR(Opcode.String, p1=len(text), p2=addr, p4=text)
 
 
-@dataclass
 class Instruction:
     """
     Each instruction has an opcode and five operands named P1, P2 P3, P4, and P5
@@ -115,14 +173,87 @@ class Instruction:
     Otherwise NULL values compare different from one another.
 
     Some opcodes use all five operands. Some opcodes use one or two. Some opcodes use none of the operands.
+
+    The opcode is stored as it's int value (op) so the VM can index
+    straight into it's dispatch table. Opcode is an IntEnum so op can be
+    compared with it's members directly.
+
+    Programs can hold thousands of instructions so they use __slots__
+    rather than a __dict__ per instance.
     """
 
-    opcode: Opcode
-    p1: int = 0
-    p2: int = 0
-    p3: int = 0
-    p4: Optional[Union[str, int]] = None  # TODO narrow type
-    p5: int = 0
+    __slots__ = ("op", "p1", "p2", "p3", "p4", "p5")
+
+    def __init__(
+        self,
+        op: Union[Opcode, int],
+        *,
+        p1: int = 0,
+        p2: int = 0,
+        p3: int = 0,
+        # A tuple for EmitRow's columns or BulkInsert's rows.
+        p4: Optional[Union[str, int, Tuple[Any, ...]]] = None,
+        p5: int = 0,
+    ):
+        # int() so op is a plain int rather than the IntEnum member.
+        self.op = int(op)
+        self.p1 = p1
+        self.p2 = p2
+        self.p3 = p3
+        self.p4 = p4
+        self.p5 = p5
+
+    def astuple(self) -> Tuple:
+        return (self.op, self.p1, self.p2, self.p3, self.p4, self.p5)
+
+    def replace(self, **changes) -> "Instruction":
+        """
+        Returns a copy with the given operands changed.
+        """
+        op, p1, p2, p3, p4, p5 = self.astuple()
+        instruction = Instruction(op, p1=p1, p2=p2, p3=p3, p4=p4, p5=p5)
+        for name, value in changes.items():
+            setattr(instruction, name, value)
+
+        return instruction
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Instruction):
+            return NotImplemented
+
+        return self.astuple() == other.astuple()
+
+    def __hash__(self) -> int:
+        return hash(self.astuple())
+
+    @property
+    def opcode(self) -> Opcode:
+        return Opcode(self.op)
+
+    def __repr__(self) -> str:
+        return (
+            f"Instruction({self.opcode.name}, p1={self.p1}, p2={self.p2}, "
+            f"p3={self.p3}, p4={self.p4!r}, p5={self.p5})"
+        )
+
+
+# Loop body opcodes whose p1 is the cursor being read.
+CURSOR_OPCODES = {Opcode.Key, Opcode.Column, Opcode.ColumnRange, Opcode.EmitRow}
+
+
+def count_cursors(instructions: List[Instruction]) -> int:
+    """
+    Number of cursors a program opens, cursors are numbered from 0
+    by the OpenRead/OpenWrite p1.
+    """
+    return max(
+        (
+            instruction.p1 + 1
+            for instruction in instructions
+            if instruction.op == Opcode.OpenRead or instruction.op == Opcode.OpenWrite
+        ),
+        default=0,
+    )
 
 
 @dataclass
@@ -146,38 +277,654 @@ class Program:
 
     irs: List[InstructionIR]
     instructions: List[Instruction]
+    # (instruction, literal index) for each instruction that loads
+    # a literal from the sql text. See Program.bind.
+    literals: List[Tuple[Any, int]] = field(default_factory=list)
+    # Registers are numbered 0 - num_registers-1, the VM allocates them up front.
+    num_registers: int = 0
+    # Cursors are numbered 0 - num_cursors-1, also allocated up front.
+    num_cursors: int = 0
+    # Specialised python version of the program, see compile_to_python.
+    python: Optional[Callable] = field(default=None, repr=False, compare=False)
+    # (instruction address, literal index) of literals, see bind.
+    literal_positions: Optional[List[Tuple[int, int]]] = field(
+        default=None, repr=False, compare=False
+    )
 
     def compile(self):
         """
         This converts it's intermediate representation (ir) into an instruction set.
         resolving pointers to addresses etc.
         """
+        compiled = {}
+        # The compiler emits jump targets as addresses already, this is
+        # only built if an ir still points at another ir.
+        addresses = None
+
         for ir in self.irs:
-            attrs = ["p1", "p2", "p3", "p4", "p5"]
-            instruction = Instruction(ir.opcode)
+            operands = [ir.p1, ir.p2, ir.p3, ir.p4, ir.p5]
 
-            for a in attrs:
-                value = getattr(ir, a)
+            for i, value in enumerate(operands):
                 if isinstance(value, InstructionIR):
-                    setattr(instruction, a, self.irs.index(value))
-                else:
-                    setattr(instruction, a, value)
+                    if addresses is None:
+                        # id rather than irs.index, which is O(n) and compares
+                        # every ir with the dataclass __eq__ on the way.
+                        addresses = {
+                            id(other): address for address, other in enumerate(self.irs)
+                        }
+                    operands[i] = addresses[id(value)]
+
+            p1, p2, p3, p4, p5 = operands
+
+            if ir.opcode in INTERNED_OPCODES:
+                key = (ir.opcode, p1, p2, p3, p4, p5)
+                instruction = INTERNED_INSTRUCTIONS.get(key)
+                if instruction is None:
+                    instruction = Instruction(
+                        ir.opcode, p1=p1, p2=p2, p3=p3, p4=p4, p5=p5
+                    )
+                    INTERNED_INSTRUCTIONS[key] = instruction
+            else:
+                instruction = Instruction(ir.opcode, p1=p1, p2=p2, p3=p3, p4=p4, p5=p5)
 
+            compiled[id(ir)] = instruction
             self.instructions.append(instruction)
 
+        self.literals = [(compiled[id(ir)], i) for ir, i in self.literals]
 
-SCHEMA_TABLE_NAME = "schema"
-SCHEMA_TABLE_SQL_TEXT = f"CREATE TABLE {SCHEMA_TABLE_NAME} (id INTEGER, schema_type TEXT, name TEXT, t_name TEXT, sql_text TEXT, root_page_number INTEGER);"
+    def bind(self, literals: List[str]) -> "Program":
+        """
+        Returns a copy of this (template) program with the literal values
+        patched into the instructions that load them.
 
+        Compiled instructions are never mutated so the copy shares
+        every instruction that isn't patched.
+        """
+        if self.literal_positions is None:
+            # Worked out on the first bind, the template is bound on
+            # every compile of a statement like it.
+            index = {
+                id(instruction): i for i, instruction in enumerate(self.instructions)
+            }
+            self.literal_positions = [
+                (index[id(instruction)], i) for instruction, i in self.literals
+            ]
+
+        instructions = self.instructions.copy()
+
+        for position, i in self.literal_positions:
+            value = literals[i]
+            instruction = instructions[position]
+            if instruction.op == Opcode.String:
+                instructions[position] = Instruction(
+                    instruction.op, p1=len(value), p2=instruction.p2, p4=value
+                )
+            else:
+                instructions[position] = Instruction(
+                    instruction.op, p1=int(value), p2=instruction.p2
+                )
 
-# Fancy counter
-@dataclass
-class Memory:
-    address = 0
+        return Program(
+            [],
+            instructions,
+            num_registers=self.num_registers,
+            num_cursors=self.num_cursors,
+            python=self.python,
+        )
+
+    def compile_to_python(self) -> Optional[Callable]:
+        """
+        Generates a python generator function equivalent to this program,
+        so the VM can skip dispatching each instruction, eg:
+
+            Integer   2  0          def run(pager):
+            OpenRead  0  0  4           cursor_0 = BTree(pager, 2)
+            Rewind    0  6              if not cursor_0.is_empty():
+            Key       0  1                  for record in cursor_0:
+            Column    0  1  2                   values = record.values
+            ResultRow 1  2                      yield [record.row_id, values[1][1]]
+            Next      0  3
+            Close     0
+            Halt
+
+        Only scans are supported, for any other opcode this returns None
+        and the program is interpreted by the VM.
+        """
+        instructions = self.instructions
+        # register -> python expression holding it's value.
+        registers = {}
+        src = ["def run(pager):"]
+        indent = "    "
+        pc = 0
+
+        while pc < len(instructions):
+            instruction = instructions[pc]
+            opcode = instruction.op
+
+            if opcode == Opcode.Integer:
+                registers[instruction.p2] = repr(instruction.p1)
+            elif opcode == Opcode.OpenRead and instruction.p2 in registers:
+                cursor = f"cursor_{instruction.p1}"
+                src.append(
+                    f"{indent}{cursor} = BTree(pager, {registers[instruction.p2]})"
+                )
+            elif opcode == Opcode.Rewind:
+                # The loop body runs from here up to the Next which jumps back
+                # to the start of it, Rewind must jump just after that Next.
+                end = instruction.p2 - 1
+                loop = instructions[end] if 0 < end < len(instructions) else None
+
+                if (
+                    loop is None
+                    or loop.op != Opcode.Next
+                    or loop.p1 != instruction.p1
+                    or loop.p2 != pc + 1
+                ):
+                    return None
+
+                cursor = f"cursor_{instruction.p1}"
+                src.append(f"{indent}if not {cursor}.is_empty():")
+                src.append(f"{indent}    for record in {cursor}:")
+                src.append(f"{indent}        values = record.values")
+
+                for body in instructions[pc + 1 : end]:
+                    if body.op in CURSOR_OPCODES and body.p1 != instruction.p1:
+                        return None
+
+                    if body.op == Opcode.Key:
+                        registers[body.p2] = "record.row_id"
+                    elif body.op == Opcode.Column:
+                        registers[body.p3] = f"values[{body.p2}][1]"
+                    elif body.op == Opcode.ColumnRange:
+                        for k in range(cast(int, body.p4)):
+                            registers[body.p3 + k] = f"values[{body.p2 + k}][1]"
+                    elif body.op == Opcode.EmitRow:
+                        columns = ", ".join(
+                            f"values[{i}][1]" for i in cast(tuple, body.p4)
+                        )
+                        src.append(f"{indent}        yield [{columns}]")
+                    elif body.op == Opcode.ResultRow:
+                        result = range(body.p1, body.p2 + 1)
+                        if any(r not in registers for r in result):
+                            return None
+
+                        columns = ", ".join(registers[r] for r in result)
+                        src.append(f"{indent}        yield [{columns}]")
+                    else:
+                        return None
+
+                pc = end
+            elif opcode == Opcode.Close:
+                pass
+            elif opcode == Opcode.Halt and instruction.p1 == 0:
+                src.append(f"{indent}return")
+            else:
+                return None
+
+            pc += 1
+
+        # Make sure it's a generator even if nothing is yielded.
+        src.append(f"{indent}yield from ()")
+        code = compile("\n".join(src), f"<program:{id(self):x}>", "exec")
+        namespace = {}
+        exec(code, {"BTree": BTree}, namespace)
+
+        return namespace["run"]
+
+    def pack(self) -> Tuple[array, List[Union[str, int]]]:
+        """
+        Packs the instructions into one flat array of ints,
+        PACKED_FIELDS per instruction, instead of a list of python objects.
+
+        p4 doesn't have a fixed size so it's kept in a pool and the
+        instruction stores it's index into the pool (-1 for None).
+        """
+        packed = array("q")
+        pool = []
+
+        for instruction in self.instructions:
+            p4_index = -1
+            if instruction.p4 is not None:
+                p4_index = len(pool)
+                pool.append(instruction.p4)
+
+            packed.extend(
+                (
+                    instruction.op,
+                    instruction.p1,
+                    instruction.p2,
+                    instruction.p3,
+                    instruction.p5,
+                    p4_index,
+                )
+            )
+
+        return packed, pool
+
+    @staticmethod
+    def unpack(
+        packed: array, pool: List[Union[str, int]], num_registers: int
+    ) -> "Program":
+        instructions = []
+
+        for i in range(0, len(packed), PACKED_FIELDS):
+            opcode, p1, p2, p3, p5, p4_index = packed[i : i + PACKED_FIELDS]
+            p4 = None if p4_index == -1 else pool[p4_index]
+            instructions.append(
+                Instruction(Opcode(opcode), p1=p1, p2=p2, p3=p3, p4=p4, p5=p5)
+            )
+
+        return Program(
+            [],
+            instructions,
+            num_registers=num_registers,
+            num_cursors=count_cursors(instructions),
+        )
+
+    def to_bytes(self) -> bytes:
+        """
+        Serializes the compiled program, so it can be cached on disk:
+
+            PROGRAM_HEADER
+            packed instructions (see pack)
+            (instruction index, literal index) for each literal
+            the p4 pool, each entry a length prefixed repr
+
+        The arrays are in native byte order, the cache is only
+        meant to be read back on the same machine.
+        """
+        packed, pool = self.pack()
+        index = {id(instruction): i for i, instruction in enumerate(self.instructions)}
+        literals = array(
+            "q",
+            [
+                n
+                for instruction, i in self.literals
+                for n in (index[id(instruction)], i)
+            ],
+        )
+
+        data = [
+            PROGRAM_HEADER.pack(
+                PROGRAM_MAGIC,
+                PROGRAM_VERSION,
+                len(self.instructions),
+                len(pool),
+                len(self.literals),
+                self.num_registers,
+            ),
+            packed.tobytes(),
+            literals.tobytes(),
+        ]
+
+        for value in pool:
+            entry = repr(value).encode("utf-8")
+            data.append(POOL_ENTRY.pack(len(entry)))
+            data.append(entry)
+
+        return b"".join(data)
+
+    @staticmethod
+    def from_bytes(data: bytes) -> "Program":
+        (
+            magic,
+            version,
+            number_of_instructions,
+            pool_size,
+            number_of_literals,
+            num_registers,
+        ) = PROGRAM_HEADER.unpack_from(data)
+
+        if magic != PROGRAM_MAGIC or version != PROGRAM_VERSION:
+            raise ProgramVersionException(
+                "Not a compiled program or compiled by another version"
+            )
+
+        offset = PROGRAM_HEADER.size
+        packed = array("q")
+        size = number_of_instructions * PACKED_FIELDS * packed.itemsize
+        packed.frombytes(data[offset : offset + size])
+        offset += size
+
+        literals = array("q")
+        size = number_of_literals * 2 * literals.itemsize
+        literals.frombytes(data[offset : offset + size])
+        offset += size
+
+        pool = []
+        for _ in range(pool_size):
+            [length] = POOL_ENTRY.unpack_from(data, offset)
+            offset += POOL_ENTRY.size
+            # p4 only ever holds ints, strings and tuples of them.
+            pool.append(literal_eval(data[offset : offset + length].decode("utf-8")))
+            offset += length
+
+        program = Program.unpack(packed, pool, num_registers)
+        program.literals = [
+            (program.instructions[literals[i]], literals[i + 1])
+            for i in range(0, len(literals), 2)
+        ]
+        return program
+
+    def __reduce__(self):
+        # Pickled as it's to_bytes, the generated python version can't be
+        # pickled so it's generated again when the program is loaded.
+        return (Program.unpickle, (self.to_bytes(), self.python is not None))
+
+    @staticmethod
+    def unpickle(data: bytes, python: bool) -> "Program":
+        program = Program.from_bytes(data)
+        if python:
+            program.python = program.compile_to_python()
+
+        return program
+
+
+# opcode, p1, p2, p3, p5, p4_index
+PACKED_FIELDS = 6
+
+# magic, version, number of instructions, pool size, number of literals, num_registers
+PROGRAM_HEADER = struct.Struct("<IIIIII")
+PROGRAM_MAGIC = 0x7059514C
+# Bump whenever the opcodes or the layout change.
+PROGRAM_VERSION = 1
+POOL_ENTRY = struct.Struct("<I")
+
+# Opcodes which jump to the address in p2.
+JUMP_OPCODES = {
+    op.value
+    for op in [
+        Opcode.Eq,
+        Opcode.Ne,
+        Opcode.Lt,
+        Opcode.Le,
+        Opcode.Gt,
+        Opcode.Ge,
+        Opcode.Rewind,
+        Opcode.Next,
+        Opcode.Prev,
+        Opcode.SeekGt,
+        Opcode.SeekGe,
+        Opcode.SeekLt,
+        Opcode.IdxGt,
+        Opcode.IdxLt,
+        Opcode.IdxLe,
+    ]
+}
+
+
+# These only ever hold constants and are never patched or relocated,
+# so one instance of each is shared by every program.
+INTERNED_OPCODES = {Opcode.Halt, Opcode.Close, Opcode.Noop}
+INTERNED_INSTRUCTIONS = {}
+
+
+def check_jumps(instructions: List[Instruction]):
+    """
+    Jump targets are resolved to addresses at compile time so the VM just
+    assigns p2 to the pc, make sure each one lands inside the program.
+    """
+    for address, instruction in enumerate(instructions):
+        if instruction.op in JUMP_OPCODES:
+            target = instruction.p2
+            in_program = isinstance(target, int) and 0 <= target < len(instructions)
+            assert in_program, f"{instruction} at {address} jumps outside the program"
+
+
+def relocate(instructions: List[Instruction], addresses: List[int]):
+    """
+    After a pass has dropped instructions, point the jumps at
+    the new addresses. addresses maps old address -> new address.
+
+    instructions is the pass's own list, the jumps in it are replaced
+    with copies since the originals can be shared with a cached program.
+    """
+    for i, instruction in enumerate(instructions):
+        if instruction.op in JUMP_OPCODES:
+            instructions[i] = instruction.replace(p2=addresses[instruction.p2])
+
+
+def fuse_column_ranges(instructions: List[Instruction]) -> List[Instruction]:
+    """
+    Replaces runs of Columns on the same cursor where both the column
+    indexes and destination registers are contiguous:
+
+        Column 0 1 2
+        Column 0 2 3
+        Column 0 3 4
+
+    with a single ColumnRange, p1 is the cursor, p2 the first column,
+    p3 the first register and p4 how many columns to copy.
+    """
+    fused = []
+    addresses = []
+    i = 0
+    column = Opcode.Column
+
+    while i < len(instructions):
+        instruction = instructions[i]
+        j = i + 1
+
+        if instruction.op == column:
+            while (
+                j < len(instructions)
+                and instructions[j].op == column
+                and instructions[j].p1 == instruction.p1
+                and instructions[j].p2 == instruction.p2 + j - i
+                and instructions[j].p3 == instruction.p3 + j - i
+            ):
+                j += 1
+
+        if j - i > 1:
+            fused.append(
+                Instruction(
+                    Opcode.ColumnRange,
+                    p1=instruction.p1,
+                    p2=instruction.p2,
+                    p3=instruction.p3,
+                    p4=j - i,
+                )
+            )
+            # Nothing jumps into the middle of a run.
+            addresses.extend([len(fused) - 1] * (j - i))
+        else:
+            addresses.append(len(fused))
+            fused.append(instruction)
+
+        i = j
+
+    # Jumps can also land just past the end of the program.
+    addresses.append(len(fused))
+    relocate(fused, addresses)
+    return fused
+
+
+def fuse_result_rows(instructions: List[Instruction]) -> List[Instruction]:
+    """
+    Replaces the body of a scan loop:
+
+        Key, Column, Column, ..., ResultRow, Next
+
+    (the Columns can also be ColumnRanges)
+
+    with a single EmitRow that reads the columns straight from the current
+    row, followed by the Next. This saves a dispatch per column per row.
+
+    EmitRow p1 is the cursor, p2 - p3 the ResultRow registers and
+    p4 the column indexes to emit.
+    """
+    fused = []
+    addresses = []
+    i = 0
+
+    while i < len(instructions):
+        instruction = instructions[i]
+        cursor = instruction.p1
+
+        # Map each register the loop body writes to it's column index.
+        columns = {}
+        j = i
+        while j < len(instructions) and instructions[j].p1 == cursor:
+            if instructions[j].op == Opcode.Key:
+                # The key is stored as the first value of the row.
+                columns[instructions[j].p2] = 0
+            elif instructions[j].op == Opcode.Column:
+                columns[instructions[j].p3] = instructions[j].p2
+            elif instructions[j].op == Opcode.ColumnRange:
+                for k in range(cast(int, instructions[j].p4)):
+                    columns[instructions[j].p3 + k] = instructions[j].p2 + k
+            else:
+                break
+            j += 1
+
+        if (
+            j > i
+            and j + 1 < len(instructions)
+            and instructions[j].op == Opcode.ResultRow
+            and instructions[j + 1].op == Opcode.Next
+            and instructions[j + 1].p1 == cursor
+            and instructions[j + 1].p2 == i
+            and all(
+                r in columns for r in range(instructions[j].p1, instructions[j].p2 + 1)
+            )
+        ):
+            result_row = instructions[j]
+            registers = range(result_row.p1, result_row.p2 + 1)
+            addresses.extend([len(fused)] * (j - i + 1))
+            fused.append(
+                Instruction(
+                    Opcode.EmitRow,
+                    p1=cursor,
+                    p2=result_row.p1,
+                    p3=result_row.p2,
+                    p4=tuple(columns[r] for r in registers),
+                )
+            )
+            i = j + 1
+        else:
+            addresses.append(len(fused))
+            fused.append(instruction)
+            i += 1
+
+    # Jumps can also land just past the end of the program.
+    addresses.append(len(fused))
+    relocate(fused, addresses)
+    return fused
+
+
+# Peephole passes run in order when the compiler is asked to fuse.
+PEEPHOLE_PASSES = [fuse_column_ranges, fuse_result_rows]
+
+
+# MakeRecord's p4 is a string with a character per column giving it's type,
+# like sqlite's affinity string
+AFFINITIES = {DataType.integer: "i", DataType.text: "t"}
+AFFINITY_TYPES = {affinity: t for t, affinity in AFFINITIES.items()}
+
+
+@lru_cache(maxsize=128)
+def record_builder(affinities: str) -> Callable[[List[Any], int], List[List[Any]]]:
+    """
+    Generates a function building the record values for MakeRecord, the
+    column types are known when compiling so the VM doesn't infer them
+    one register at a time, eg for "iti":
+
+        def make_record(registers, first):
+            return [
+                [integer, registers[first]],
+                [text, registers[first + 1]],
+                [integer, registers[first + 2]],
+            ]
+    """
+    columns = ", ".join(
+        f"[{AFFINITY_TYPES[affinity].name}, registers[first + {i}]]"
+        for i, affinity in enumerate(affinities)
+    )
+    source = f"def make_record(registers, first):\n    return [{columns}]\n"
+    namespace: Dict[str, Any] = {t.name: t for t in AFFINITY_TYPES.values()}
+    exec(compile(source, f"<record {affinities}>", "exec"), namespace)
+    return namespace["make_record"]
+
+
+# Integer and text literals in sql text, '' is an escaped quote.
+# Quoted identifiers are matched first so digits in them aren't taken as literals.
+LITERAL_PATTERN = re.compile(r'"(?:[^"]|"")*"' + r"|'(?:[^']|'')*'|\b\d+\b")
+DDL_PATTERN = re.compile(r"^\s*create\b", re.IGNORECASE)
+# An insert with more than one VALUES row, ie a "), (" after the first row.
+# Matched against the template so it can't be inside a string literal.
+MULTI_ROW_INSERT_PATTERN = re.compile(
+    r"^\s*insert\b.*?\)\s*,\s*\(", re.IGNORECASE | re.DOTALL
+)
+
+
+@lru_cache(maxsize=1024)
+def parse_sql(sql_text: str) -> Tuple[Any, ...]:
+    """
+    Lexes and parses sql_text. Parsing only depends on the text and
+    statements are never mutated after, so they're shared between callers.
+    Binding them to the schema happens in the compiler which isn't cached here.
+    """
+    return tuple(parse(lex(sql_text)))
+
+
+@lru_cache(maxsize=128)
+def column_names_from_sql_text(sql_text: str) -> Tuple[str, ...]:
+    """
+    Column names of a select or create statement. The same create sql gets
+    read out of the schema table over and over so it's cached, the tuple
+    keeps callers from mutating the shared result.
+    """
+    [statement] = parse_sql(sql_text)
+
+    names = []
+    if isinstance(statement, SelectStatement):
+        for col in statement.items:
+            if col.value != "*":
+                names.append(col.value)
+
+    if isinstance(statement, CreateStatement):
+        for col in statement.columns:
+            if col.name.value != "*":
+                names.append(col.name.value)
+
+    if isinstance(statement, InsertStatement):
+        raise NotImplemented(
+            "InsertStatement get_column_names_from_sql_text not NotImplemented"
+        )
+
+    return tuple(names)
+
+
+def parameterize(sql_text: str) -> Tuple[str, List[str]]:
+    """
+    Splits sql_text into a template, where each literal is replaced
+    with a placeholder literal of the same type, and the literal values.
+
+        INSERT INTO products VALUES(1, 'Hard Drive')
+        -> "INSERT INTO products VALUES(0, '')", ["1", "Hard Drive"]
+
+    Statements that only differ by their literals share a template.
+    """
+    literals = []
 
-    def next_addr(self):
-        self.address += 1
-        return self.address - 1
+    def placeholder(match) -> str:
+        literal = match.group(0)
+        if literal.startswith('"'):
+            # An identifier, it's part of the template.
+            return literal
+
+        if literal.startswith("'"):
+            literals.append(literal[1:-1].replace("''", "'"))
+            return "''"
+
+        literals.append(literal)
+        return "0"
+
+    return LITERAL_PATTERN.sub(placeholder, sql_text), literals
+
+
+SCHEMA_TABLE_NAME = "schema"
+SCHEMA_TABLE_SQL_TEXT = f"CREATE TABLE {SCHEMA_TABLE_NAME} (id INTEGER, schema_type TEXT, name TEXT, t_name TEXT, sql_text TEXT, root_page_number INTEGER);"
 
 
 class Compiler:
@@ -185,11 +932,43 @@ class Compiler:
     Given a Statement the compiler will produce a Program for the VM to execute.
     """
 
-    def __init__(self, pager: Pager):
+    def __init__(self, pager: Pager, fuse: bool = False, program_cache: bool = False):
         self.pager = pager
+        # Run the peephole passes over compiled programs.
+        # Off by default so programs read 1:1 with the sqlite opcodes.
+        self.fuse = fuse
+        # Persist compiled templates next to the db file so they
+        # survive restarts, see program_cache_path.
+        self.program_cache = program_cache
+        # Bumped on every CREATE, compiled programs bake in
+        # root pages and columns so they're cached per generation.
+        self.schema_generation = 0
+        # table name -> (root page number, create sql_text), loaded from
+        # the schema table on first use and again after every CREATE.
+        self._schema_cache = {}
+        self._schema_loaded = False
+        # table name -> column names and (table name, select items) -> column
+        # indexes, both cleared on CREATE along with the schema.
+        self._column_names_cache = {}
+        self._column_index_cache = {}
+        # Kept apart from the methods they wrap so their cache_info type checks.
+        self._template_cache = lru_cache(maxsize=512)(self._compile_template)
+        self._statement_cache = lru_cache(maxsize=256)(self._prepare_statement)
+        # Statement type -> method laying out it's instructions.
+        self.statement_compilers = {
+            SelectStatement: self._compile_select,
+            InsertStatement: self._compile_insert,
+            CreateStatement: self._compile_create,
+        }
         # These are needed to parse schema_table.sql_text
         # values to interpret column names and types
         self.init_schema_table()
+        # The schema table never changes so it's columns are only
+        # worked out once, and it's cursor is reused for every read.
+        self.schema_table_column_names = self.get_column_names_from_sql_text(
+            SCHEMA_TABLE_SQL_TEXT
+        )
+        self.schema_cursor = BTree(self.pager, 0)
 
     def init_schema_table(self):
         if len(self.pager) == 0:
@@ -197,52 +976,61 @@ class Compiler:
 
     def get_schema(self) -> List[List[Any]]:
         # Gets the current schema table values
-        cursor = BTree(self.pager, 0)
-        rows = [[r[1] for r in record.values] for record in cursor]
+        rows = [[r[1] for r in record.values] for record in self.schema_cursor]
 
         return rows
 
     def prepare(self, sql_text: str):
-        tokens = lex(sql_text)
-        stmts = parse(tokens)
+        return parse_sql(sql_text)
 
-        return stmts
+    def get_column_names_from_sql_text(self, sql_text: str) -> Tuple[str, ...]:
+        return column_names_from_sql_text(sql_text)
 
-    def get_column_names_from_sql_text(self, sql_text: str):
-        [statement] = self.prepare(sql_text)
+    def literal_value(self, token):
+        if token.type == DataType.integer:
+            return int(token.value)
 
-        names = []
-        if isinstance(statement, SelectStatement):
-            for col in statement.items:
-                if col.value != "*":
-                    names.append(col.value)
+        if token.type == DataType.text:
+            return token.value
 
-        if isinstance(statement, CreateStatement):
-            for col in statement.columns:
-                if col.name.value != "*":
-                    names.append(col.name.value)
+        # TODO: handle NULL.
+        raise Exception(f"Unsupported value {token.value}")
 
-        if isinstance(statement, InsertStatement):
-            raise NotImplemented(
-                "InsertStatement get_column_names_from_sql_text not NotImplemented"
-            )
+    def get_table_schema(self, table_name: str) -> Tuple[int, str]:
+        """
+        Returns the (root page number, create sql_text) of table_name.
+        """
+        if not self._schema_loaded or table_name not in self._schema_cache:
+            # Either it's the first lookup or the table could have
+            # been created since, so (re)load the schema table.
+            self._schema_cache = {
+                record[2]: (record[4], record[5]) for record in self.get_schema()
+            }
+            self._schema_loaded = True
+
+        if table_name not in self._schema_cache:
+            raise TableFoundException(f"Table: {table_name} not found")
 
-        return names
+        return self._schema_cache[table_name]
 
     def get_table_create_stmt(self, table_name):
         if table_name == SCHEMA_TABLE_NAME:
             return SCHEMA_TABLE_SQL_TEXT
 
-        for values in self.get_schema():
-            if values[2] == table_name:
-                sql_text = values[5]
-                return sql_text
-
-        raise TableFoundException(f"Table: {table_name} not found")
+        _, sql_text = self.get_table_schema(table_name)
+        return sql_text
 
     def get_table_column_names(self, table_name):
-        sql_text = self.get_table_create_stmt(table_name)
-        return self.get_column_names_from_sql_text(sql_text)
+        if table_name == SCHEMA_TABLE_NAME:
+            return self.schema_table_column_names
+
+        if table_name not in self._column_names_cache:
+            sql_text = self.get_table_create_stmt(table_name)
+            self._column_names_cache[table_name] = self.get_column_names_from_sql_text(
+                sql_text
+            )
+
+        return self._column_names_cache[table_name]
 
     def get_primary_key_index(self, table_name):
         sql_text = self.get_table_create_stmt(table_name)
@@ -255,8 +1043,17 @@ class Compiler:
         return 0
 
     def get_column_indexes(self, statement: SelectStatement):
+        key = (statement._from.value, tuple(item.value for item in statement.items))
+
+        if key not in self._column_index_cache:
+            self._column_index_cache[key] = self._get_column_indexes(statement)
+
+        return self._column_index_cache[key]
+
+    def _get_column_indexes(self, statement: SelectStatement):
         column_index = []
         column_names = self.get_table_column_names(statement._from.value)
+        name_to_index = {name: i for i, name in enumerate(column_names)}
 
         for column_name in statement.items:
             if column_name.value == "*":
@@ -264,7 +1061,10 @@ class Compiler:
                 column_index = list(range(0, len(column_names)))
                 break
 
-            column_index.append(column_names.index(column_name.value))
+            if column_name.value not in name_to_index:
+                raise ValueError(f"Column: {column_name.value} not found")
+
+            column_index.append(name_to_index[column_name.value])
 
         return column_index
 
@@ -273,92 +1073,218 @@ class Compiler:
         if table_name == SCHEMA_TABLE_NAME:
             return 0
 
-        for record in self.get_schema():
-            if record[2] == table_name:
-                root_page_number = record[4]
-                return root_page_number
-
-        raise TableFoundException(f"Table: {table_name} not found")
+        root_page_number, _ = self.get_table_schema(table_name)
+        return root_page_number
 
     def compile(self, sql_text) -> Program:
-        # Initally we assume only one statement.
-        [statement] = self.prepare(sql_text)
-        program = Program([], [])
-        memory = Memory()
+        """
+        Compiles sql_text, reusing the program compiled for any previous
+        statement which only differed by it's literals.
+        """
+        template, literals = parameterize(sql_text)
 
-        if isinstance(statement, SelectStatement):
-            table_page_number = self.get_table_root_page_number(
-                str(statement._from.value)
-            )
+        if MULTI_ROW_INSERT_PATTERN.match(template):
+            # The rows end up in BulkInsert's p4 rather than a register each so
+            # the template could never be bound, and ETL style statements
+            # rarely repeat, so skip every cache rather than fill them up.
+            [statement] = parse(tokenize(sql_text))
+            return self._compile(sql_text, statement)
 
-            column_count = 4
-            table_cursor = 0
-            instructions = []
+        if DDL_PATTERN.match(template):
+            # DDL changes the schema, and it's sql_text is stored so never cache it.
+            return self._compile(sql_text)
 
-            instructions.append(
-                InstructionIR(
-                    Opcode.Integer, p1=table_page_number, p2=memory.next_addr()
-                )
-            )
-            instructions.append(
-                InstructionIR(Opcode.OpenRead, p1=table_cursor, p2=0, p3=column_count)
-            )
+        program = self._template_cache(template, self.schema_generation, self.fuse)
 
-            close = InstructionIR(Opcode.Close, p1=0)
-            instructions.append(InstructionIR(Opcode.Rewind, p1=0, p2=close))
+        if len(program.literals) != len(literals):
+            # Not every literal is loaded by a single instruction
+            # so we can't patch them in.
+            return self._compile(sql_text)
 
-            key_addr = memory.next_addr()
-            instructions.append(InstructionIR(Opcode.Key, p1=0, p2=key_addr))
+        return program.bind(literals)
 
-            columns = []
-            column_indexes = self.get_column_indexes(statement)
-            for i in column_indexes:
-                if i > 0:
-                    columns.append(
-                        InstructionIR(Opcode.Column, p1=0, p2=i, p3=memory.next_addr())
-                    )
+    def prepare_statement(self, sql_text) -> Program:
+        """
+        Compiles sql_text once for statements that are executed over and over,
+        the program is cached by it's exact sql_text so it skips even the
+        parameterize and bind steps of compile.
 
-            first_column_addr = key_addr if 0 in column_indexes else columns[0].p3
-            instructions.extend(columns)
-            instructions.append(
-                InstructionIR(
-                    Opcode.ResultRow, p1=first_column_addr, p2=len(columns) + 1
-                )
-            )
-            instructions.append(InstructionIR(Opcode.Next, p1=0, p2=3))
-            instructions.extend([close, InstructionIR(Opcode.Halt, p1=0, p2=0)])
+        The same program is returned to every caller so it mustn't be modified.
+        """
+        if DDL_PATTERN.match(sql_text):
+            return self.compile(sql_text)
+
+        return self._statement_cache(sql_text, self.schema_generation, self.fuse)
+
+    def _prepare_statement(
+        self, sql_text: str, schema_generation: int, fuse: bool
+    ) -> Program:
+        # schema_generation and fuse are only here to be part of the cache key.
+        return self.compile(sql_text)
+
+    def _compile_template(
+        self, template: str, schema_generation: int, fuse: bool
+    ) -> Program:
+        # schema_generation and fuse are only here to be part of the cache key.
+        program = None
+        path = self.program_cache_path(template) if self.program_cache else None
+
+        if path is not None and path.exists():
+            try:
+                program = Program.from_bytes(path.read_bytes())
+            except (
+                ProgramVersionException,
+                struct.error,
+                ValueError,
+                SyntaxError,
+                IndexError,
+            ):
+                # Truncated, corrupt or from another version, a cache
+                # mustn't break the query so it's compiled again below
+                # and the file overwritten.
+                program = None
+
+        if program is None:
+            program = self._compile(template)
+
+            if path is not None:
+                path.parent.mkdir(exist_ok=True)
+                # Write then rename so a reader never sees half a program.
+                tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+                tmp_path.write_bytes(program.to_bytes())
+                os.replace(tmp_path, path)
+
+        if not program.literals:
+            # Generated once per template, the bound copies share it.
+            program.python = program.compile_to_python()
 
-            program.irs = instructions
+        return program
 
-        if isinstance(statement, InsertStatement):
-            table_cursor = 0
-            table_page_number = self.get_table_root_page_number(
-                str(statement.into.value)
-            )
-            table_page_number_addr = memory.next_addr()
-            instructions = []
+    def program_cache_path(self, template: str) -> Path:
+        """
+        {db_file}.pcache/{sha256}.prg, the hash covers everything the
+        compiled program depends on: the template, whether it was fused
+        and the schema (root pages and create statements).
+        """
+        key = "\0".join([template, str(self.fuse), repr(self.get_schema())])
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return Path(f"{self.pager.file_path}.pcache") / f"{digest}.prg"
 
-            instructions.append(
+    def _compile(self, sql_text, statement=None) -> Program:
+        if statement is None:
+            # Initally we assume only one statement.
+            [statement] = self.prepare(sql_text)
+
+        program = Program([], [])
+        # Registers are handed out in order, num_registers is how many were.
+        num_registers = 0
+
+        def next_addr():
+            nonlocal num_registers
+            num_registers += 1
+            return num_registers - 1
+
+        compile_statement = self.statement_compilers[type(statement)]
+        program.irs = compile_statement(statement, sql_text, program, next_addr)
+        program.compile()
+        program.num_registers = num_registers
+        program.num_cursors = count_cursors(program.instructions)
+
+        if self.fuse:
+            for peephole_pass in PEEPHOLE_PASSES:
+                program.instructions = peephole_pass(program.instructions)
+
+        check_jumps(program.instructions)
+        return program
+
+    def _compile_select(
+        self, statement, sql_text, program, next_addr
+    ) -> List[InstructionIR]:
+        table_page_number = self.get_table_root_page_number(statement._from.value)
+
+        column_count = 4
+        table_cursor = 0
+
+        # Jumps to the Close, it's address is patched in once it's known.
+        rewind = InstructionIR(Opcode.Rewind, p1=0, p2=0)
+        instructions = [
+            load_integer(table_page_number, next_addr()),
+            InstructionIR(Opcode.OpenRead, p1=table_cursor, p2=0, p3=column_count),
+            rewind,
+        ]
+
+        loop_start = len(instructions)
+        key_addr = next_addr()
+        instructions.append(InstructionIR(Opcode.Key, p1=0, p2=key_addr))
+
+        columns = []
+        column_indexes = self.get_column_indexes(statement)
+        for i in column_indexes:
+            if i > 0:
+                columns.append(InstructionIR(Opcode.Column, p1=0, p2=i, p3=next_addr()))
+
+        first_column_addr = key_addr if 0 in column_indexes else columns[0].p3
+        instructions.extend(columns)
+        instructions.extend(
+            [
                 InstructionIR(
-                    Opcode.Integer,
-                    p1=table_page_number,
-                    p2=table_page_number_addr,
-                    p3=0,
+                    Opcode.ResultRow, p1=first_column_addr, p2=len(columns) + 1
+                ),
+                InstructionIR(Opcode.Next, p1=0, p2=loop_start),
+            ]
+        )
+        rewind.p2 = len(instructions)
+        instructions.extend(
+            [
+                InstructionIR(Opcode.Close, p1=0),
+                InstructionIR(Opcode.Halt, p1=0, p2=0),
+            ]
+        )
+        return instructions
+
+    def _compile_insert(
+        self, statement, sql_text, program, next_addr
+    ) -> List[InstructionIR]:
+        table_cursor = 0
+        table_page_number = self.get_table_root_page_number(statement.into.value)
+        table_page_number_addr = next_addr()
+
+        instructions = [
+            load_integer(table_page_number, table_page_number_addr),
+            # TODO: get number of columns from schema stmt - replace 3.
+            InstructionIR(
+                Opcode.OpenWrite, p1=table_cursor, p2=table_page_number_addr, p3=3
+            ),
+        ]
+
+        pk_index = self.get_primary_key_index(statement.into.value)
+        number_of_columns = len(self.get_table_column_names(statement.into.value))
+
+        for row in statement.rows or [statement.values]:
+            # Checked up front so a bad row can't fail the insert part way through.
+            if len(row) != number_of_columns:
+                raise ValueError(
+                    f"Table: {statement.into.value} has {number_of_columns} columns "
+                    f"but {len(row)} values were supplied"
                 )
+
+        if len(statement.rows) > 1:
+            # Carry every row in one instruction rather than laying out
+            # registers + MakeRecord + Insert for each of them.
+            rows = tuple(
+                tuple(self.literal_value(token) for token in row)
+                for row in statement.rows
             )
-            # TODO: get number of columns from schema stmt - replace 3.
             instructions.append(
-                InstructionIR(
-                    Opcode.OpenWrite, p1=table_cursor, p2=table_page_number_addr, p3=3
-                )
+                InstructionIR(Opcode.BulkInsert, p1=table_cursor, p2=pk_index, p4=rows)
             )
-
+        else:
             pk_addr = None
             first_column_addr = None
-            pk_index = self.get_primary_key_index(statement.into.value)
+            affinities = []
 
             for i, token in enumerate(statement.values):
-                addr = memory.next_addr()
+                addr = next_addr()
                 if i == 0:
                     first_column_addr = addr
 
@@ -366,142 +1292,95 @@ class Compiler:
                     pk_addr = addr
 
                 if token.type == DataType.integer:
-                    instructions.append(
-                        InstructionIR(Opcode.Integer, p1=int(token.value), p2=addr)
-                    )
+                    ir = load_integer(int(token.value), addr)
+                    instructions.append(ir)
+                    program.literals.append((ir, i))
 
                 if token.type == DataType.text:
-                    instructions.append(
-                        InstructionIR(
-                            Opcode.String,
-                            p1=len(str(token.value)),
-                            p2=addr,
-                            p4=token.value,
-                        )
-                    )
+                    ir = load_string(token.value, addr)
+                    instructions.append(ir)
+                    program.literals.append((ir, i))
 
                 # TODO: handle NULL.
-            record_addr = memory.next_addr()
+                affinities.append(AFFINITIES[token.type])
+            record_addr = next_addr()
             assert first_column_addr
-            instructions.append(
-                InstructionIR(
-                    Opcode.MakeRecord,
-                    p1=first_column_addr,
-                    p2=len(statement.values),
-                    p3=record_addr,
-                )
-            )
-
             # TODO: How is this figured? This means we need to load the btree cursor?
             assert pk_addr
-            instructions.append(
-                InstructionIR(
-                    Opcode.Insert, p1=table_cursor, p2=record_addr, p3=pk_addr
-                )
+            instructions.extend(
+                [
+                    InstructionIR(
+                        Opcode.MakeRecord,
+                        p1=first_column_addr,
+                        p2=len(statement.values),
+                        p3=record_addr,
+                        p4="".join(affinities),
+                    ),
+                    InstructionIR(
+                        Opcode.Insert, p1=table_cursor, p2=record_addr, p3=pk_addr
+                    ),
+                ]
             )
 
-            instructions.append(
-                InstructionIR(Opcode.Close, p1=table_cursor),
-            )
-            program.irs = instructions
-
-        if isinstance(statement, CreateStatement):
-            instructions = []
-            schema_root_page_num = 0
-            schema_root_page_num_addr = memory.next_addr()
-            # Layout the registers
-            schema_type_addr = memory.next_addr()
-            schema_type = "table"
-            item_name_addr = memory.next_addr()
-            item_name = str(statement.table.value)
-            associated_table_name_addr = memory.next_addr()
-            associated_table_name = str(statement.table.value)
-            root_page_num_addr = memory.next_addr()
-            text = sql_text
-            text_addr = memory.next_addr()
-
-            column_count = 5
-
-            schema_cursor = 0
-
-            instructions.append(
-                InstructionIR(
-                    Opcode.Integer,
-                    p1=schema_root_page_num,
-                    p2=schema_root_page_num_addr,
-                )
-            )
-            instructions.append(
-                InstructionIR(
-                    Opcode.OpenWrite,
-                    p1=schema_cursor,
-                    p2=schema_root_page_num_addr,
-                    p3=column_count,
-                )
-            )
-            instructions.append(
-                InstructionIR(Opcode.CreateTable, p1=root_page_num_addr)
-            )
-            instructions.append(
-                InstructionIR(
-                    Opcode.String,
-                    p1=len(schema_type),
-                    p2=schema_type_addr,
-                    p4=schema_type,
-                )
-            )
-            instructions.append(
-                InstructionIR(
-                    Opcode.String, p1=len(item_name), p2=item_name_addr, p4=item_name
-                )
-            )
-            instructions.append(
-                InstructionIR(
-                    Opcode.String,
-                    p1=len(associated_table_name),
-                    p2=associated_table_name_addr,
-                    p4=associated_table_name,
-                )
-            )
-
-            instructions.append(
-                InstructionIR(
-                    Opcode.String,
-                    p1=len(text),
-                    p2=text_addr,
-                    p4=text,
-                )
-            )
-
-            record_addr = memory.next_addr()
-            instructions.append(
-                InstructionIR(
-                    Opcode.MakeRecord,
-                    p1=schema_type_addr,
-                    p2=column_count,
-                    p3=record_addr,
-                )
-            )
-
-            primary_key = len(self.get_schema()) + 1
-            primary_key_addr = memory.next_addr()
+        instructions.append(
+            InstructionIR(Opcode.Close, p1=table_cursor),
+        )
+        return instructions
+
+    def _compile_create(
+        self, statement, sql_text, program, next_addr
+    ) -> List[InstructionIR]:
+        self.schema_generation += 1
+        self._schema_loaded = False
+        self._column_names_cache.clear()
+        self._column_index_cache.clear()
+        schema_root_page_num = 0
+        schema_root_page_num_addr = next_addr()
+        # Layout the registers
+        schema_type_addr = next_addr()
+        schema_type = "table"
+        item_name_addr = next_addr()
+        item_name = statement.table.value
+        associated_table_name_addr = next_addr()
+        associated_table_name = item_name
+        root_page_num_addr = next_addr()
+        text = sql_text
+        text_addr = next_addr()
+
+        column_count = 5
+
+        schema_cursor = 0
+
+        record_addr = next_addr()
+        primary_key = len(self.get_schema()) + 1
+        primary_key_addr = next_addr()
+
+        instructions = [
+            load_integer(schema_root_page_num, schema_root_page_num_addr),
+            InstructionIR(
+                Opcode.OpenWrite,
+                p1=schema_cursor,
+                p2=schema_root_page_num_addr,
+                p3=column_count,
+            ),
+            InstructionIR(Opcode.CreateTable, p1=root_page_num_addr),
+            load_string(schema_type, schema_type_addr),
+            load_string(item_name, item_name_addr),
+            load_string(associated_table_name, associated_table_name_addr),
+            load_string(text, text_addr),
+            InstructionIR(
+                Opcode.MakeRecord,
+                p1=schema_type_addr,
+                p2=column_count,
+                p3=record_addr,
+                # The root page number register sits between the names and text.
+                p4="tttit",
+            ),
             # TODO: I'm not sure why we don't use seek end + Key opcodes to get the primary key?
-            instructions.append(
-                InstructionIR(Opcode.Integer, p1=primary_key, p2=primary_key_addr)
-            )
-
-            instructions.append(
-                InstructionIR(
-                    Opcode.Insert, p1=schema_cursor, p2=record_addr, p3=primary_key_addr
-                ),
-            )
-
-            instructions.append(
-                InstructionIR(Opcode.Close, p1=schema_cursor),
-            )
-
-            program.irs = instructions
-
-        program.compile()
-
-        return program
+            load_integer(primary_key, primary_key_addr),
+            InstructionIR(
+                Opcode.Insert, p1=schema_cursor, p2=record_addr, p3=primary_key_addr
+            ),
+            InstructionIR(Opcode.Close, p1=schema_cursor),
+        ]
+        return instructions
@@ -20,3 +20,7 @@ class LexingException(Exception):
 
 class ParsingException(Exception):
     pass
+
+
+class ProgramVersionException(Exception):
+    pass
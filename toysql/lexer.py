@@ -1,8 +1,8 @@
 from dataclasses import dataclass
+from functools import lru_cache
 from enum import Enum, auto
-from io import StringIO
 from toysql.exceptions import LexingException
-from typing import List, Optional, Union
+from typing import Callable, Dict, Optional, Tuple, Union, cast
 
 
 class Identifier(Enum):
@@ -87,97 +87,92 @@ class Location:
 
 
 class Cursor:
-    def __init__(self, text) -> None:
-        self.reader = StringIO(text)
+    """
+    Position in the text being lexed. Everything is worked out from
+    the pointer so reading never copies more than what's asked for.
+    """
 
-    @property
-    def pointer(self):
-        return self.reader.tell()
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.pointer = 0
+        # Line number at line_pointer, see line_no.
+        self.line_pointer = 0
+        self.line = 0
 
     def __len__(self) -> int:
         """
         length of underlying str.
         """
-        return len(self.reader.getvalue())
+        return len(self.text)
 
-    def peek(self, size=1) -> str:
+    def peek(self, size: int = 1) -> str:
         """
-        stringIO doesn't have peek
         peek reads the current character
         without advancing the cursor.
         """
-        pointer = self.reader.tell()
-        value = self.read(size)
-        self.reader.seek(pointer)
+        return self.text[self.pointer : self.pointer + size]
 
-        return value
-
-    def read(self, size=None) -> str:
+    def read(self, size: Optional[int] = None) -> str:
         """
-        Reads remaining text from current index without moving the cursor
+        Reads size characters (or the remaining text) and advances the cursor.
         """
-        return self.reader.read(size)
+        start = self.pointer
+        end = len(self.text) if size is None else min(start + size, len(self.text))
+        self.pointer = end
+        return self.text[start:end]
 
     def is_complete(self) -> bool:
-        return self.reader.tell() == len(self)
+        return self.pointer >= len(self.text)
 
-    def line_no(self) -> int:
+    def line_no(self, pointer: Optional[int] = None) -> int:
         """
-        Calculates the current line number
-        of the cursor.
+        Calculates the line number at pointer (the cursor by default).
+        Tokens ask in order so the newlines are only counted since the
+        last call.
         """
-        pointer = self.reader.tell()
-        count = 0
+        if pointer is None:
+            pointer = self.pointer
 
-        self.reader.seek(0)
-        buffer = self.reader.read(pointer)
-        count += buffer.count("\n")
+        if pointer < self.line_pointer:
+            self.line_pointer = 0
+            self.line = 0
 
-        self.reader.seek(pointer)
-        return count
+        self.line += self.text.count("\n", self.line_pointer, pointer)
+        self.line_pointer = pointer
+        return self.line
 
-    def column_no(self) -> int:
+    def column_no(self, pointer: Optional[int] = None) -> int:
         """
         Calculates the character count since the last
         line break.
         """
-        pointer = self.reader.tell()
-        start = pointer
-
-        while True:
-            # Find the beginning of the
-            # line
-            self.reader.seek(start)
-            value = self.peek()
-            if start == 0:
-                break
-
-            if value == "\n":
-                # This counts as previous line
-                # so add one char.
-                start += 1
-                break
+        if pointer is None:
+            pointer = self.pointer
 
-            start -= 1
+        return pointer - (self.text.rfind("\n", 0, pointer) + 1)
 
-        count = pointer - start
-
-        self.reader.seek(pointer)
-
-        return count
-
-    def location(self) -> Location:
-        """Returns (line_number, col) of `index` in `s`."""
-        return Location(self.line_no(), self.column_no())
+    def location(self, pointer: Optional[int] = None) -> Location:
+        """
+        Returns (line_number, col) of pointer (the cursor by default),
+        lexers only ask for it once they've matched a token.
+        """
+        return Location(self.line_no(pointer), self.column_no(pointer))
 
 
 @dataclass
 class Token:
+    __slots__ = ("value", "type", "loc", "kind")
+
     value: str
     type: TokenType
     loc: Optional[Location]
 
-    def __init__(self, type: TokenType, loc: Optional[Location] = None, value=None):
+    def __init__(
+        self,
+        type: TokenType,
+        loc: Optional[Location] = None,
+        value: Optional[str] = None,
+    ):
         self.type = type
         self.loc = loc
 
@@ -192,130 +187,175 @@ class Token:
         else:
             raise Exception("Unknown token type -> kind mapping")
 
+        # Values are always str, the compiler relies on it to skip converting.
         if value is None:
-            self.value = self.type.value
+            # Only keywords and symbols are made without a value, theirs are str.
+            self.value = cast(str, self.type.value)
         else:
             self.value = value
 
 
-def is_alphabetical(c: str):
-    return (c >= "A" and c <= "Z") or (c >= "a" and c <= "z")
+# Character classes, a character's bits are looked up in CHAR_CLASS
+# rather than comparing it against each range.
+DIGIT = 1
+ALPHA = 2
+# Can continue an identifier.
+IDENTIFIER = 4
+# Can start a number.
+NUMBER = 8
 
 
-def is_digit(c: str):
-    return c >= "0" and c <= "9"
+def build_char_class() -> Dict[str, int]:
+    char_class: Dict[str, int] = {}
 
+    def add(chars, bits):
+        for c in chars:
+            char_class[c] = char_class.get(c, 0) | bits
 
-def is_period(c: str):
-    return c == "."
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    digits = "0123456789"
+    add(digits, DIGIT | IDENTIFIER | NUMBER)
+    add(letters + letters.upper(), ALPHA | IDENTIFIER)
+    add("$_", IDENTIFIER)
+    add(".", NUMBER)
 
+    return char_class
 
-def is_exp_marker(c: str):
-    return c == "e"
 
+CHAR_CLASS = build_char_class()
 
-def keyword_lexer(cursor: Cursor) -> Optional[Token]:
-    cursor_start = cursor.location()
+
+def build_keyword_trie() -> dict:
+    """
+    Each node maps a character to the next node, the node the last
+    character of a keyword leads to holds the Keyword under None.
+    Keywords are case insensitive so both cases lead to the same node.
+    """
+    trie: dict = {}
+
+    for keyword in Keyword:
+        node = trie
+        for c in keyword.value:
+            child = node.get(c)
+            if child is None:
+                child = node[c] = node[c.upper()] = {}
+            node = child
+        node[None] = keyword
+
+    return trie
+
+
+KEYWORD_TRIE = build_keyword_trie()
+
+
+def match_keyword(source: str, start: int) -> Optional[Keyword]:
+    """
+    Walks the keyword trie from source[start], returning the longest keyword
+    that's either a full word or at the end of source.
+    """
+    node = KEYWORD_TRIE
     match = None
-    options = [e.value for e in Keyword]
-    options.sort(key=len, reverse=True)
-
-    for option in options:
-        l = len(option)
-
-        substr = cursor.peek(l)
-        lower_substr = substr.lower()
-        if lower_substr == option:
-            # matched.
-
-            # Now we need to make sure it's either
-            # a full word OR it's the end of the string.
-            # cursor.peek will return as much as it can
-            # even if you give a length greater than
-            # the underlying string. That's why we
-            # check l == len(with_next_char)
-            with_next_char = cursor.peek(l + 1)
-
-            if l == len(with_next_char) or not is_alphabetical(with_next_char[-1]):
-                # now makesure it's a complete word
-                # but checking the next char is a space.
-                cursor.read(l)
-                match = lower_substr
+    i = start
+    end = len(source)
+
+    while i < end:
+        node = node.get(source[i])
+        if node is None:
+            break
+
+        i += 1
+        keyword = node.get(None)
+        if keyword is not None and (
+            i == end or not CHAR_CLASS.get(source[i], 0) & ALPHA
+        ):
+            match = keyword
+
+    return match
+
+
+def keyword_lexer(cursor: Cursor) -> Optional[Token]:
+    start = cursor.pointer
+    match = match_keyword(cursor.text, cursor.pointer)
 
     if match is None:
         return None
 
-    return Token(type=Keyword(match), loc=cursor_start)
+    cursor.read(len(match.value))
+    return Token(type=match, loc=cursor.location(start))
 
 
-def numeric_lexer(cursor: Cursor):
+def numeric_lexer(cursor: Cursor) -> Optional[Token]:
     # TODO - this currently handles
     # floating points - we should
     # instead just do floats.
-    cursor_start = cursor.location()
+    start = cursor.pointer
     period_found = False
     exp_marker_found = False
 
-    c = cursor.peek()
-    value = ""
-
-    if not is_digit(c) and not is_period(c):
+    char_class = CHAR_CLASS.get
+    if not char_class(cursor.peek(), 0) & NUMBER:
         return None
 
-    while not cursor.is_complete():
-        c = cursor.peek()
+    # Scan with an index into the text, the value is sliced out once at the end.
+    text = cursor.text
+    end = len(text)
+    i = start
+
+    while i < end:
+        c = text[i]
 
-        if is_period(c):
+        if c == ".":
             if period_found:
                 # What cases would you have ".."?
+                cursor.pointer = i
                 return None
 
             period_found = True
-            value += cursor.read(1)
+            i += 1
             continue
 
-        if is_exp_marker(c):
+        if c == "e":
             if exp_marker_found:
+                cursor.pointer = i
                 return None
 
             # No periods allowed after expMarker
             period_found = True
             exp_marker_found = True
 
-            c_next = cursor.peek()
-            if c_next == "-" or c_next == "+":
-                value += cursor.read(1)
+            if i + 1 < end and text[i + 1] in "-+":
+                i += 1
 
-            value += cursor.read(1)
+            i += 1
             continue
 
-        if not is_digit(c):
+        if not char_class(c, 0) & DIGIT:
             break
 
-        value += cursor.read(1)
+        i += 1
 
-    # No characters accumulated
-    if len(value) == 0:
-        return None
+    cursor.pointer = i
+    value = text[start:i]
+
+    return Token(type=DataType.integer, loc=cursor.location(start), value=value)
 
-    return Token(type=DataType.integer, loc=cursor_start, value=value)
 
+# Symbol value -> Symbol, built once rather than per token.
+SYMBOLS = {symbol.value: symbol for symbol in Symbol}
 
-def symbol_lexer(cursor: Cursor):
-    options = [e.value for e in Symbol]
-    cursor_start = cursor.location()
-    current = cursor.peek()
 
-    try:
-        options.index(current)
-    except ValueError:
+def symbol_lexer(cursor: Cursor) -> Optional[Token]:
+    start = cursor.pointer
+    symbol = SYMBOLS.get(cursor.peek())
+
+    if symbol is None:
         return None
 
     cursor.read(1)
 
     return Token(
-        type=Symbol(current),
-        loc=cursor_start,
+        type=symbol,
+        loc=cursor.location(start),
     )
 
 
@@ -325,89 +365,134 @@ class DelimitedLexer:
         self.type = type
         self.kind = kind
 
-    def lex(self, cursor: Cursor):
-        cursor_start = cursor.location()
-        if cursor.peek() != self.delimiter:
+    def lex(self, cursor: Cursor) -> Optional[Token]:
+        start = cursor.pointer
+        delimiter = self.delimiter
+        if cursor.peek() != delimiter:
             return None
 
-        # Now we have found the delimiter
-        # we want to continue until we find the
-        # end delimiter.
-        cursor.read(1)
+        # Now we have found the delimiter we jump to the end delimiter
+        # with str.find. A doubled delimiter is an escaped one, only
+        # then is the value joined together from parts.
+        text = cursor.text
+        parts = []
+        i = start + 1
 
-        value = ""
-        while not cursor.is_complete():
-            if cursor.peek() == self.delimiter:
-                # Move over the delimiter.
-                cursor.read(1)
+        while True:
+            j = text.find(delimiter, i)
+            if j == -1:
+                cursor.pointer = len(text)
+                return None
+
+            if text.startswith(delimiter, j + 1):
+                parts.append(text[i : j + 1])
+                i = j + 2
+                continue
 
-                return Token(type=self.type, loc=cursor_start, value=value)
+            break
 
-            value += cursor.read(1)
+        value = text[i:j]
+        if parts:
+            parts.append(value)
+            value = "".join(parts)
 
-        return None
+        # Move over the delimiter.
+        cursor.pointer = j + 1
+        return Token(type=self.type, loc=cursor.location(start), value=value)
 
 
-def text_lexer(cursor: Cursor):
-    lexer = DelimitedLexer("'", DataType.text, Kind.datatype)
-    return lexer.lex(cursor)
+# The delimited lexers don't hold any state so they're shared.
+TEXT_LEXER = DelimitedLexer("'", DataType.text, Kind.datatype)
+QUOTED_IDENTIFIER_LEXER = DelimitedLexer('"', Identifier.long, Kind.identifier)
 
 
-def identifier_lexer(cursor: Cursor):
+def text_lexer(cursor: Cursor) -> Optional[Token]:
+    return TEXT_LEXER.lex(cursor)
+
+
+def identifier_lexer(cursor: Cursor) -> Optional[Token]:
     # Look for double quote texts.
-    cursor_start = cursor.location()
-    token = DelimitedLexer('"', Identifier.long, Kind.identifier).lex(cursor)
+    start = cursor.pointer
+    token = QUOTED_IDENTIFIER_LEXER.lex(cursor)
 
     if token:
         return token
 
-    c = cursor.peek()
-
-    if not is_alphabetical(c):
+    if not CHAR_CLASS.get(cursor.peek(), 0) & ALPHA:
         return None
 
-    value = cursor.read(1)
+    # Scan with an index into the text, the value is sliced out once at the end.
+    text = cursor.text
+    char_class = CHAR_CLASS.get
+    end = len(text)
+    i = start + 1
 
-    while not cursor.is_complete():
-        c = cursor.peek()
+    while i < end and char_class(text[i], 0) & IDENTIFIER:
+        i += 1
 
-        is_numeric = c >= "0" and c <= "9"
+    cursor.pointer = i
+    value = text[start:i]
 
-        if is_alphabetical(c) or is_numeric or c == "$" or c == "_":
-            value += cursor.read(1)
-            continue
+    return Token(type=Identifier.long, loc=cursor.location(start), value=value.lower())
 
-        break
 
-    if len(value) == 0:
-        return None
+def build_lexer_table() -> Dict[str, Tuple[Callable, ...]]:
+    """
+    First character -> the lexers that can match a token starting with it,
+    in the order they get to try. A character outside the table can't
+    start any token.
+    """
+    table: Dict[str, Tuple[Callable, ...]] = {}
+
+    def add(chars, *lexers):
+        for c in chars:
+            table[c] = table.get(c, ()) + lexers
+
+    letters = [c for c, bits in CHAR_CLASS.items() if bits & ALPHA]
+    # Note keyword should always have first pick.
+    add(letters, keyword_lexer, identifier_lexer)
+    add([value[0] for value in SYMBOLS], symbol_lexer)
+    add([c for c, bits in CHAR_CLASS.items() if bits & NUMBER], numeric_lexer)
+    add("'", text_lexer)
+    add('"', identifier_lexer)
+
+    return table
+
 
-    return Token(type=Identifier.long, loc=cursor_start, value=value.lower())
+LEXERS = build_lexer_table()
+DISCARD_CHARACTERS = frozenset(" \n\r")
 
 
-def lex(source: str) -> List[Token]:
+@lru_cache(maxsize=1024)
+def lex(source: str) -> Tuple[Token, ...]:
+    """
+    Splits source into tokens. The same statements get lexed over and
+    over so it's cached by source, tokens are returned as a tuple so the
+    cached result can't be changed by a caller.
+    """
+    return tokenize(source)
+
+
+def tokenize(source: str) -> Tuple[Token, ...]:
+    """
+    lex without the cache, for statements that aren't worth keeping.
+    """
     source = source.strip()
-    discard_characters = [" ", "\n", "\r"]
     tokens = []
     cursor = Cursor(source)
-    # Explicitly describe type here
-    # So we ensure each of these is a lexer.
-    lexers = [
-        keyword_lexer,  # Note keyword should always have first pick.
-        symbol_lexer,
-        numeric_lexer,
-        text_lexer,
-        identifier_lexer,
-    ]
-
-    while not cursor.is_complete():
-        if cursor.peek() in discard_characters:
+    text = cursor.text
+    end = len(text)
+    lexers = LEXERS
+
+    while cursor.pointer < end:
+        c = text[cursor.pointer]
+        if c in DISCARD_CHARACTERS:
             # move the cursor forward
             # when discarding things.
-            cursor.read(1)
+            cursor.pointer += 1
             continue
 
-        for lexer in lexers:
+        for lexer in lexers.get(c, ()):
             token = lexer(cursor)
             if token:
                 tokens.append(token)
@@ -421,4 +506,4 @@ def lex(source: str) -> List[Token]:
                 f"Lexing error at location {location.line}:{location.col}"
             )
 
-    return tokens
+    return tuple(tokens)
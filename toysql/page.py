@@ -1,8 +1,19 @@
-from typing import Optional, List
+from typing import Optional, List, Final
 from enum import Enum
-from toysql.record import Record, Integer
+from toysql.record import Record, Integer, decode_varint
+from array import array
 import bisect
-import io
+import struct
+
+# page_number, page_type, free block pointer, number of cells, cell content offset
+PAGE_HEADER = struct.Struct(">BBHHH")
+# Page numbers of children, the interior right child and each InteriorPageCell.
+CHILD_POINTER = struct.Struct(">I")
+
+PAGE_SIZE: Final = 4096
+LEAF_HEADER_SIZE: Final = PAGE_HEADER.size
+# Interior pages also store the right child after the header.
+INTERIOR_HEADER_SIZE: Final = PAGE_HEADER.size + CHILD_POINTER.size
 
 
 class PageType(Enum):
@@ -10,21 +21,13 @@ class PageType(Enum):
     interior = 1
 
 
-class FixedInteger:
-    @staticmethod
-    def to_bytes(length, value):
-        return value.to_bytes(length, "big")
-
-    @staticmethod
-    def from_bytes(data):
-        return int.from_bytes(data, "big")
-
-
 class Cell:
     """
     Cell interface
     """
 
+    __slots__ = ()
+
     row_id = 0
 
     def to_bytes(self):
@@ -46,51 +49,68 @@ class LeafPageCell(Cell):
     which adds some metadata depending on the surrounding
 
     A cell should be sortable by key. (PK)
+
+    Cells read from a page only decode their row_id up front, the
+    record is decoded from a view of the page bytes when it's first used.
+    Until then to_bytes hands back the original bytes.
     """
 
+    __slots__ = ("row_id", "_record", "_raw", "_record_offset")
+
     def __init__(self, payload: Record) -> None:
         if isinstance(payload, Record):
-            self.record = payload
+            self._record = payload
         else:
-            self.record = Record(payload)
+            self._record = Record(payload)
+
+        self.row_id = self._record.row_id
+        self._raw = None
+        self._record_offset = 0
 
     @property
-    def row_id(self):
-        return self.record.row_id
+    def record(self) -> Record:
+        if self._record is None:
+            # Only from_bytes leaves _record unset and it always sets _raw.
+            assert self._raw is not None
+            self._record = Record.from_bytes(self._raw[self._record_offset :])
+            # The record can be changed from here on so the raw bytes are stale.
+            self._raw = None
+
+        return self._record
 
     def __eq__(self, o: "LeafPageCell") -> bool:
-        return self.record == o.record
+        # Compares the contents not just the key, to_bytes is
+        # a copy of the raw bytes while the record isn't decoded.
+        return self.to_bytes() == o.to_bytes()
 
     def to_bytes(self):
         """
         pass
         """
-        buff = io.BytesIO()
-        record_bytes = self.record.to_bytes()
-        record_size = Integer(len(record_bytes)).to_bytes()
-        row_id = Integer(self.record.row_id).to_bytes()
+        if self._raw is not None:
+            return bytes(self._raw)
 
-        buff.write(record_size)
-        buff.write(row_id)
-        buff.write(record_bytes)
+        record_bytes = self._record.to_bytes()
+        record_size = Integer(len(record_bytes)).to_bytes()
+        row_id = Integer(self.row_id).to_bytes()
 
-        buff.seek(0)
-        return buff.read()
+        return record_size + row_id + record_bytes
 
     @staticmethod
     def from_bytes(data) -> "LeafPageCell":
         """
         First read two varints record_size + row_id
-        Then read the record payload
+        The record payload is left in data until it's needed.
         """
-        buff = io.BytesIO(data)
-        record_size = Integer.from_bytes(buff.read())
-        buff.seek(record_size.content_length())
-        row_id = Integer.from_bytes(buff.read())
-        buff.seek(record_size.content_length() + row_id.content_length())
-        record = Record.from_bytes(buff.read(record_size.value))
-
-        return LeafPageCell(record)
+        record_size, offset = decode_varint(data)
+        row_id, offset = decode_varint(data, offset)
+
+        cell = LeafPageCell.__new__(LeafPageCell)
+        cell.row_id = row_id
+        cell._record = None
+        cell._raw = memoryview(data)[: offset + record_size]
+        cell._record_offset = offset
+        return cell
 
 
 class InteriorPageCell(Cell):
@@ -101,6 +121,8 @@ class InteriorPageCell(Cell):
     A varint which is the integer key.
     """
 
+    __slots__ = ("row_id", "left_child_page_number")
+
     def __init__(self, row_id, left_child_page_number) -> None:
         self.row_id = row_id
         self.left_child_page_number = left_child_page_number
@@ -109,25 +131,17 @@ class InteriorPageCell(Cell):
         return self.row_id == o.row_id
 
     def to_bytes(self):
-        buff = io.BytesIO()
-        page_number = FixedInteger.to_bytes(4, self.left_child_page_number)
+        page_number = CHILD_POINTER.pack(self.left_child_page_number)
         row_id = Integer(self.row_id).to_bytes()
-
-        buff.write(page_number)
-        buff.write(row_id)
-
-        buff.seek(0)
-        return buff.read()
+        return page_number + row_id
 
     @staticmethod
     def from_bytes(data) -> "InteriorPageCell":
         """
         Just reading the left_child_page and the varint.
         """
-        buff = io.BytesIO(data)
-
-        left_child_page_number = FixedInteger.from_bytes(buff.read(4))
-        row_id = Integer.from_bytes(buff.read()).value
+        [left_child_page_number] = CHILD_POINTER.unpack_from(data)
+        row_id, _ = decode_varint(data, CHILD_POINTER.size)
 
         return InteriorPageCell(row_id, left_child_page_number)
 
@@ -137,8 +151,21 @@ class Page:
     header is 8 bytes in size for leaf pages and 12 bytes for interior pages
 
     Cells are expected to be sorted before hand useing cells.sort()
+
+    keys holds the row_id of each cell in the same order,
+    so lookups can bisect it rather than scanning cells.
     """
 
+    __slots__ = (
+        "page_type",
+        "page_number",
+        "_cells",
+        "keys",
+        "parent",
+        "right_child_page_number",
+        "page_size",
+    )
+
     parent: Optional["Page"]
 
     def __init__(
@@ -147,7 +174,7 @@ class Page:
         page_number,
         cells=None,
         right_child_page_number=None,
-        page_size=4096,
+        page_size=PAGE_SIZE,
     ) -> None:
         self.page_type = PageType(page_type)
         self.page_number = page_number
@@ -158,6 +185,15 @@ class Page:
         self.right_child_page_number = right_child_page_number
         self.page_size = page_size
 
+    @property
+    def cells(self) -> List:
+        return self._cells
+
+    @cells.setter
+    def cells(self, cells):
+        self._cells = cells
+        self.keys = array("q", [cell.row_id for cell in cells])
+
     def __repr__(self):
         cell_ids = [str(cell.row_id) for cell in self.cells]
         return ",".join(cell_ids)
@@ -226,24 +262,34 @@ class Page:
         if exists:
             self.remove_cell(exists)
 
-        bisect.insort(self.cells, cell)
+        i = bisect.bisect_right(self.keys, cell.row_id)
+        self._cells.insert(i, cell)
+        self.keys.insert(i, cell.row_id)
         return cell
 
     def remove_cell(self, cell):
-        self.cells.remove(cell)
+        # Cells are matched by row_id, their contents may differ.
+        keys = self.keys
+        i = bisect.bisect_left(keys, cell.row_id)
+        if i == len(keys) or keys[i] != cell.row_id:
+            raise ValueError(f"No cell with row_id {cell.row_id}")
+
+        del self._cells[i]
+        del self.keys[i]
 
     def find_cell(self, row_id):
-        for cell in self.cells:
-            if cell.row_id == row_id:
-                return cell
+        keys = self.keys
+        i = bisect.bisect_left(keys, row_id)
+        if i < len(keys) and keys[i] == row_id:
+            return self._cells[i]
 
         return None
 
     def header_size(self):
-        if self.page_type == PageType.leaf:
-            return 8
+        if self.page_type is PageType.leaf:
+            return LEAF_HEADER_SIZE
 
-        return 12
+        return INTERIOR_HEADER_SIZE
 
     def __len__(self):
         header_size = self.header_size()
@@ -255,17 +301,12 @@ class Page:
         """
         Returns the body as bytes
         """
-        cell_offsets = b""
-        cell_data = b""
-
-        for cell in self.cells:
-            cell_bytes = cell.to_bytes()
-            # Add offset for each cell from the cell Content area.
-            # TODO this isn't a true offset. But it makes it easy to read
-            # All of them.
-            offset = FixedInteger.to_bytes(2, len(cell_bytes))
-            cell_offsets += offset
-            cell_data += cell_bytes
+        cells = [cell.to_bytes() for cell in self.cells]
+        # Add offset for each cell from the cell Content area.
+        # TODO this isn't a true offset. But it makes it easy to read
+        # All of them.
+        cell_offsets = struct.pack(f">{len(cells)}H", *[len(cell) for cell in cells])
+        cell_data = b"".join(cells)
 
         return [cell_offsets, cell_data]
 
@@ -273,37 +314,35 @@ class Page:
         """
         Page header: https://www.sqlite.org/fileformat.html#:~:text=B%2Dtree%20Page%20Header%20Format
         """
-        buff = io.BytesIO(b"".ljust(self.page_size, b"\0"))
+        data = bytearray(self.page_size)
         [cell_offsets, cell_data] = self.cells_to_bytes()
 
         cell_content_offset = len(cell_data)
 
-        # Seek negative offset of cell_content area.
-        buff.seek(-cell_content_offset, 2)
-        buff.write(cell_data)
-
-        buff.seek(0)
-        # Header
-        buff.write(FixedInteger.to_bytes(1, self.page_number))
-        # Header type.
-        buff.write(FixedInteger.to_bytes(1, self.page_type.value))
-        # Free block pointer. (Not implemented)
-        buff.write(FixedInteger.to_bytes(2, 0))
-        # Number of cells.
-        buff.write(FixedInteger.to_bytes(2, len(self.cells)))
-        # Cell Content Offset
-        buff.write(FixedInteger.to_bytes(2, cell_content_offset))
+        # cell content area sits at the end of the page.
+        data[self.page_size - cell_content_offset :] = cell_data
+
+        # Free block pointer is not implemented so always 0.
+        PAGE_HEADER.pack_into(
+            data,
+            0,
+            self.page_number,
+            self.page_type.value,
+            0,
+            len(self.cells),
+            cell_content_offset,
+        )
 
         if self.page_type == PageType.interior:
-            buff.write(FixedInteger.to_bytes(4, self.right_child_page_number))
+            CHILD_POINTER.pack_into(
+                data, PAGE_HEADER.size, self.right_child_page_number
+            )
 
         # Right after the header we add the cell_offsets
-        buff.write(cell_offsets)
-
-        # Go to the beginning so we can read everything.
-        buff.seek(0)
+        header_size = self.header_size()
+        data[header_size : header_size + len(cell_offsets)] = cell_offsets
 
-        return buff.read()
+        return bytes(data)
 
     @staticmethod
     def cell_from_bytes(page_type, raw_bytes):
@@ -316,13 +355,15 @@ class Page:
 
     @staticmethod
     def from_bytes(data) -> "Page":
-        buffer = io.BytesIO(data)
-        page_number = FixedInteger.from_bytes(buffer.read(1))
-        page_type = PageType(FixedInteger.from_bytes(buffer.read(1)))
-        # Free block pointer.
-        _ = PageType(FixedInteger.from_bytes(buffer.read(2)))
-        number_of_cells = FixedInteger.from_bytes(buffer.read(2))
-        cell_content_offset = FixedInteger.from_bytes(buffer.read(2))
+        (
+            page_number,
+            page_type,
+            _,  # Free block pointer.
+            number_of_cells,
+            cell_content_offset,
+        ) = PAGE_HEADER.unpack_from(data)
+        page_type = PageType(page_type)
+        header_size = PAGE_HEADER.size
 
         right_child_page_number = None
 
@@ -330,23 +371,21 @@ class Page:
         # are in an InteriorPageCell[key, pointer] but the right most
         # one is stored seperately.
         if page_type == PageType.interior:
-            right_child_page_number = FixedInteger.from_bytes(buffer.read(4))
-
-        cells = []
+            [right_child_page_number] = CHILD_POINTER.unpack_from(data, header_size)
+            header_size += CHILD_POINTER.size
 
         # Cell pointers
-        cell_offsets = []
+        cell_offsets = struct.unpack_from(f">{number_of_cells}H", data, header_size)
 
-        for _ in range(number_of_cells):
-            cell_offsets.append(FixedInteger.from_bytes(buffer.read(2)))
-
-        # Now read cells
-        buffer.seek(-cell_content_offset, 2)
+        # Now read cells, they keep views into data rather than copies.
+        data = memoryview(data)
+        cells = []
+        start = len(data) - cell_content_offset
 
         for offset in cell_offsets:
-            cell_content = buffer.read(offset)
-            cell = Page.cell_from_bytes(page_type, cell_content)
+            cell = Page.cell_from_bytes(page_type, data[start : start + offset])
             cells.append(cell)
+            start += offset
 
         return Page(
             page_type,
@@ -1,6 +1,6 @@
 from pathlib import Path
 import os
-from toysql.page import Page, PageType
+from toysql.page import Page, PageType, PAGE_SIZE
 from toysql.exceptions import PageNotFoundException
 
 PageNumber = int
@@ -12,11 +12,19 @@ class Pager:
     This allows you to get and set pages (chunks) of data.
     """
 
-    def __init__(self, file_path: str, page_size=4096):
+    def __init__(self, file_path: str, page_size=PAGE_SIZE):
         file_name = Path(file_path)
         file_name.touch(exist_ok=True)
+        self.file_path = file_path
         self.f = open(file_name, "rb+")
         self.page_size = page_size
+        # When a transaction is open this holds the original
+        # bytes of each page written during it.
+        self.journal = None
+        self.journal_size = 0
+        # Bumped on every change to the file so readers
+        # caching pages know when to drop them.
+        self.generation = 0
 
         if self.is_corrupt():
             raise Exception(f"{file_path} is corrupted")
@@ -44,20 +52,60 @@ class Pager:
         self.f.seek(page_number * self.page_size)
         return Page.from_bytes(self.f.read(self.page_size))
 
+    def begin(self):
+        """
+        Starts a transaction which can be undone with rollback.
+
+        Pages are journaled the first time they are written, pages appended
+        during the transaction are dropped by truncating the file.
+        """
+        self.journal = {}
+        self.journal_size = self.size()
+
+    def commit(self):
+        self.journal = None
+
+    def rollback(self):
+        if self.journal is None:
+            raise Exception("No transaction to rollback")
+
+        for page_number, data in self.journal.items():
+            self.f.seek(page_number * self.page_size)
+            self.f.write(data)
+
+        self.f.truncate(self.journal_size)
+        self.f.flush()
+        self.journal = None
+        self.generation += 1
+
+    def close(self):
+        self.f.close()
+
     def write(self, page: Page):
-        self.f.seek(page.page_number * self.page_size)
+        offset = page.page_number * self.page_size
+
+        if (
+            self.journal is not None
+            and page.page_number not in self.journal
+            and offset < self.journal_size
+        ):
+            self.f.seek(offset)
+            self.journal[page.page_number] = self.f.read(self.page_size)
+
+        self.f.seek(offset)
         self.f.write(page.to_bytes())
         self.f.flush()
+        self.generation += 1
 
         return page
 
     def __len__(self) -> int:
         current = self.f.tell()
         size = self.size()
-        l = int(size / self.page_size)
+        l = size // self.page_size
         self.f.seek(current)
         return l
 
-    def size(self) -> float:
+    def size(self) -> int:
         self.f.seek(0, os.SEEK_END)
         return self.f.tell()
@@ -1,5 +1,5 @@
-from typing import Optional, List, Protocol
-from dataclasses import dataclass
+from typing import Optional, List, Protocol, Sequence
+from dataclasses import dataclass, field
 from toysql.lexer import Token, Kind, Keyword, Symbol, DataType
 from toysql.exceptions import ParsingException
 
@@ -38,7 +38,7 @@ def match(token: Optional[Token], **kwargs) -> bool:
 
 
 class TokenCursor:
-    tokens: List[Token]
+    tokens: Sequence[Token]
     pointer: int
 
     def __init__(self, tokens) -> None:
@@ -69,8 +69,7 @@ class TokenCursor:
 
 class Statement(Protocol):
     @staticmethod
-    def parse(cursor: TokenCursor) -> "Statement":
-        ...
+    def parse(cursor: TokenCursor) -> "Statement": ...
 
 
 @dataclass
@@ -176,6 +175,8 @@ class InsertStatement(Statement):
     values: List[Token]
     into: Token
     columns: List[Token]
+    # Every tuple in the VALUES list, values is the first of them.
+    rows: List[List[Token]] = field(default_factory=list)
 
     @staticmethod
     def parse_values(cursor: TokenCursor) -> List[Token]:
@@ -233,6 +234,8 @@ class InsertStatement(Statement):
 
             INSERT INTO table_name
             VALUES (value1, value2, value3, ...);
+
+        with any number of comma seperated value tuples.
         """
         expect(cursor.current(), type=Keyword.insert)
 
@@ -260,6 +263,11 @@ class InsertStatement(Statement):
                 raise ParsingException("Expected values keyword")
 
         values = InsertStatement.parse_values(cursor)
+        rows = [values]
+
+        while match(cursor.peek(), type=Symbol.comma):
+            cursor.move()
+            rows.append(InsertStatement.parse_values(cursor))
 
         if match(cursor.peek(), type=Symbol.semicolon):
             try:
@@ -268,7 +276,9 @@ class InsertStatement(Statement):
             except StopIteration:
                 pass
 
-        return InsertStatement(into=table_identifier, values=values, columns=columns)
+        return InsertStatement(
+            into=table_identifier, values=values, columns=columns, rows=rows
+        )
 
 
 @dataclass
@@ -380,7 +390,7 @@ class CreateStatement(Statement):
         return CreateStatement(table=table_identifier, columns=columns)
 
 
-def parse(tokens: List[Token]):
+def parse(tokens: Sequence[Token]):
     stmts = []
     parsers: List[Statement] = [SelectStatement, CreateStatement, InsertStatement]
     cursor = TokenCursor(tokens)
@@ -1,6 +1,37 @@
-from typing import cast, Literal
+from typing import cast, Dict, Literal, Tuple
 from toysql.lexer import DataType
-import io
+
+
+def encode_varint(number: int) -> bytes:
+    """
+    Pack number into varint bytes, 7 bits per byte with
+    the high bit set on every byte but the last.
+    """
+    buf = bytearray()
+    while True:
+        towrite = number & 0x7F
+        number >>= 7
+        if number:
+            buf.append(towrite | 0x80)
+        else:
+            buf.append(towrite)
+            return bytes(buf)
+
+
+def decode_varint(data, offset: int = 0) -> Tuple[int, int]:
+    """
+    Reads the varint starting at offset in data,
+    returns it's value and the offset just past it.
+    """
+    shift = 0
+    result = 0
+    while True:
+        b = data[offset]
+        offset += 1
+        result |= (b & 0x7F) << shift
+        shift += 7
+        if not (b & 0x80):
+            return result, offset
 
 
 class Null:
@@ -78,8 +109,12 @@ class Integer:
     TODO: Should handle big-endian IEEE 754-2008 64-bit floating point number.
     """
 
-    serial_type_map = dict([(1, 1), (2, 2), (3, 3), (4, 4), (6, 5), (8, 6)])
-    content_length_map = dict([(1, 1), (2, 2), (3, 3), (4, 4), (5, 6), (6, 8)])
+    serial_type_map: Dict[int, IntSerialType] = dict(
+        [(1, 1), (2, 2), (3, 3), (4, 4), (6, 5), (8, 6)]
+    )
+    content_length_map: Dict[int, IntSizes] = dict(
+        [(1, 1), (2, 2), (3, 3), (4, 4), (5, 6), (6, 8)]
+    )
 
     def __init__(self, value) -> None:
         self.value = int(value)
@@ -99,17 +134,7 @@ class Integer:
         """
         Pack `value` into varint bytes
         """
-        number = self.value
-        buf = b""
-        while True:
-            towrite = number & 0x7F
-            number >>= 7
-            if number:
-                buf += bytes((towrite | 0x80,))
-            else:
-                buf += bytes((towrite,))
-                break
-        return buf
+        return encode_varint(self.value)
 
     @staticmethod
     def from_bytes(value: bytes):
@@ -142,66 +167,59 @@ class Record:
         return o.row_id == self.row_id
 
     def to_bytes(self):
-        header_data = b""
-        body_data = b""
+        header_data = []
+        body_data = []
+        serial_type_map = Integer.serial_type_map
 
         for type, value in self.values:
             if type == DataType.integer:
-                serial_type = Integer(value).serial_type()
-                header_data += Integer(serial_type).to_bytes()
-                body_data += Integer(value).to_bytes()
+                encoded = encode_varint(int(value))
+                header_data.append(encode_varint(serial_type_map[len(encoded)]))
+                body_data.append(encoded)
 
             if type == DataType.text:
-                serial_type = Text(value).serial_type()
-                header_data += Integer(serial_type).to_bytes()
-                body_data += Text(value).to_bytes()
+                encoded = value.encode("utf-8")
+                # See Text.content_length
+                header_data.append(encode_varint(len(encoded) * 2 + 13))
+                body_data.append(encoded)
 
             if type == DataType.null:
-                serial_type = Null().serial_type()
-                header_data += Integer(serial_type).to_bytes()
-                body_data += Null().to_bytes()
+                # Serial type 0, there's no body.
+                header_data.append(b"\x00")
 
-        return Integer(len(header_data)).to_bytes() + header_data + body_data
+        header = b"".join(header_data)
+        return encode_varint(len(header)) + header + b"".join(body_data)
 
     @staticmethod
     def from_bytes(data):
-        buff = io.BytesIO(data)
-        header_size = Integer.from_bytes(buff.read())
-
-        # seek to after header_size varint inorder
-        # to read the rest of the header varints
-        buff.seek(header_size.content_length())
+        """
+        Decodes in place with offsets into data, rather than
+        reading the rest of the buffer for every varint.
+        """
+        header_size, offset = decode_varint(data)
+        header_end = offset + header_size
 
         serial_types = []
-        values = []
+        while offset < header_end:
+            serial_type, offset = decode_varint(data, offset)
+            serial_types.append(serial_type)
 
-        while True:
-            cursor = buff.tell()
-            serial_type = Integer.from_bytes(buff.read())
-            serial_types.append(serial_type.value)
-            cursor += serial_type.content_length()
-            buff.seek(cursor)
-
-            if cursor == header_size.value + 1:
-                break
+        values = []
+        content_length_map = Integer.content_length_map
 
         for serial_type in serial_types:
             if serial_type == 0:
-                values.append([DataType.null, Null.from_bytes().value])
+                values.append([DataType.null, None])
 
             if 0 < serial_type < 7:
-                content_length = Integer.content_length_from_serial_type(serial_type)
-                values.append(
-                    [
-                        DataType.integer,
-                        Integer.from_bytes(buff.read(content_length)).value,
-                    ]
-                )
+                value, _ = decode_varint(data, offset)
+                offset += content_length_map[serial_type]
+                values.append([DataType.integer, value])
 
             if serial_type >= 13 and (serial_type % 2) != 0:
-                content_length = int((serial_type - 13) / 2)
-                values.append(
-                    [DataType.text, Text.from_bytes(buff.read(content_length)).value]
-                )
+                content_length = (serial_type - 13) // 2
+                text = str(data[offset : offset + content_length], "utf-8")
+                offset += content_length
+                values.append([DataType.text, text])
 
         return Record(values)
@@ -1,141 +1,249 @@
-from toysql.compiler import Program, Opcode
+from toysql.compiler import Program, Opcode, Instruction, record_builder
 from toysql.record import DataType, Record
 from toysql.btree import BTree
-from typing import cast
+from typing import Any, Callable, List, Optional, Tuple, cast
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Returned by a handler to stop the program.
+HALT = -1
+
+# python type -> DataType, anything else (eg bool) goes through DataType.infer.
+VALUE_TYPES = {int: DataType.integer, str: DataType.text, type(None): DataType.null}
+
+
+class State:
+    """
+    Per execution state shared by the opcode handlers.
+    """
+
+    def __init__(self, num_registers: int, num_cursors: int) -> None:
+        # Cursor numbers are small ints from 0 like registers.
+        self.btrees: List[Optional[BTree]] = [None] * num_cursors
+        # The compiler knows how many registers a program uses
+        # so they're allocated up front rather than growing a dict.
+        self.registers: List[Any] = [None] * num_registers
+        # Set by ResultRow, the execute loop yields it to the caller.
+        self.row: Optional[List[Any]] = None
 
 
 class VM:
+    # Opcode.value -> handler, see build_dispatch.
+    DISPATCH: Tuple[Callable[..., int], ...] = ()
+
     def __init__(self, pager):
         self.pager = pager
 
+    @classmethod
+    def build_dispatch(cls) -> Tuple[Callable[..., int], ...]:
+        """
+        Builds a table of handlers indexed by Opcode.value (Instruction.op).
+
+        Each handler takes (vm, instruction, pc, state) and returns the address
+        of the next instruction, so dispatching is a single index + call
+        rather than a comparison against every opcode. The handlers are the
+        plain functions so the table is built once for the class rather
+        than binding every method for each VM.
+        """
+        handlers = [cls.unimplemented] * (max(op.value for op in Opcode) + 1)
+
+        for op in Opcode:
+            handlers[op.value] = getattr(cls, f"_op_{op.name}", cls.unimplemented)
+
+        return tuple(handlers)
+
     def execute(self, program: Program):
-        btrees = {}
-        registers = {}
-        cursor = 0
-        print("\n".join([str(instruct) for instruct in (program.instructions)]))
-
-        while len(program.instructions) > cursor:
-            instruction = program.instructions[cursor]
-            if instruction.opcode == Opcode.CreateTable:
-                # TODO: Should be able to roll this back.
-                # RN: pager.new() will write to disk.
-                page_number = self.pager.new()
-                registers[instruction.p1] = page_number
-                cursor += 1
-
-            if instruction.opcode == Opcode.SCopy:
-                # shallow copy register value p1 -> p2.
-                registers[instruction.p2] = registers[instruction.p1]
-                cursor += 1
-
-            if instruction.opcode == Opcode.OpenWrite:
-                # Open btree with write cursor (Currently cursors don't have read/write flag)
-                # TODO: Also p4 is unimplemeneted.
-                root_page_number = registers[instruction.p2]
-                btrees[instruction.p1] = BTree(self.pager, root_page_number)
-                cursor += 1
-
-            if instruction.opcode == Opcode.OpenRead:
-                # Open a cursor with root page p2 and assign its refname to val p1
-                root_page_number = registers[instruction.p2]
-                btrees[instruction.p1] = BTree(self.pager, root_page_number)
-                cursor += 1
-
-            if instruction.opcode == Opcode.String:
-                registers[instruction.p2] = instruction.p4
-                cursor += 1
-
-            if instruction.opcode == Opcode.Integer:
-                registers[instruction.p2] = instruction.p1
-                cursor += 1
-
-            if instruction.opcode == Opcode.Noop:
-                cursor += 1
-
-            if instruction.opcode == Opcode.Rewind:
-                # If table or index is empty jump to p2
-                # else rewind the btree cursor to start.
-                tree = btrees[instruction.p1]
-
-                if tree.is_empty():
-                    cursor = cast(int, instruction.p2)
-                else:
-                    btrees[instruction.p1].reset()
-                    cursor += 1
-
-            if instruction.opcode == Opcode.Key:
-                # Read column at index p2 and store in register p3
-                row = btrees[instruction.p1].current()
-                registers[instruction.p2] = row.row_id
-                cursor += 1
-
-            if instruction.opcode == Opcode.Column:
-                # Read column at index p2 and store in register p3
-                row = btrees[instruction.p1].current()
-
-                v = row.values[instruction.p2][1]
-                registers[instruction.p3] = v
-                cursor += 1
-
-            if instruction.opcode == Opcode.MakeRecord:
-                values = []
-
-                for i in range(instruction.p2):
-                    c = []
-                    v = registers[instruction.p1 + i]
-                    t = DataType.infer(v)
-                    c.append(t)
-                    c.append(registers[instruction.p1 + i])
-                    values.append(c)
-
-                registers[instruction.p3] = values
-                cursor += 1
-
-            if instruction.opcode == Opcode.ResultRow:
-                # Take all the stored values in registers p1 - p2 and yield them
-                # to the caller.
-                values = []
-
-                for i in range(
-                    cast(int, instruction.p1), cast(int, instruction.p2) + 1
-                ):
-                    values.append(registers[i])
-
-                cursor += 1
-
-                yield values
-
-            if instruction.opcode == Opcode.Insert:
-                values = registers[instruction.p2]
-                key_with_values = [
-                    [DataType.integer, registers[instruction.p3]],
-                    *values,
-                ]
-
-                record = Record(key_with_values)
-
-                btrees[instruction.p1].insert(record)
-                registers[instruction.p2] = record
-                cursor += 1
-
-            if instruction.opcode == Opcode.Next:
-                tree = btrees[instruction.p1]
-
-                try:
-                    v = next(tree)
-                    cursor = cast(int, instruction.p2)
-                except StopIteration:
-                    cursor += 1
-
-            if instruction.opcode == Opcode.Close:
-                del btrees[instruction.p1]
-                cursor += 1
-
-            if instruction.opcode == Opcode.Halt:
-                if instruction.p1 != 0:
-                    # We have an error
-                    raise Exception(instruction.p4)
-                break
-
-        print("---end_statement---")
+        state = State(program.num_registers, program.num_cursors)
+        dispatch = self.DISPATCH
+        instructions = program.instructions
+        end = len(instructions)
+        pc = 0
+
+        if logger.isEnabledFor(logging.DEBUG):
+            # Only format the listing when someone's going to see it.
+            logger.debug("\n".join([str(instruct) for instruct in instructions]))
+
+        if program.python is not None:
+            # The compiler generated a python version of the program.
+            yield from program.python(self.pager)
+            logger.debug("---end_statement---")
+            return
+
+        while 0 <= pc < end:
+            instruction = instructions[pc]
+            pc = dispatch[instruction.op](self, instruction, pc, state)
+
+            if state.row is not None:
+                yield state.row
+                state.row = None
+
+        logger.debug("---end_statement---")
         return
+
+    def unimplemented(self, instruction: Instruction, pc: int, state: State) -> int:
+        raise Exception(f"Opcode {instruction.opcode.name} is not implemented")
+
+    def _op_CreateTable(self, instruction: Instruction, pc: int, state: State) -> int:
+        # TODO: Should be able to roll this back.
+        # RN: pager.new() will write to disk.
+        page_number = self.pager.new()
+        state.registers[instruction.p1] = page_number
+        return pc + 1
+
+    def _op_SCopy(self, instruction: Instruction, pc: int, state: State) -> int:
+        # shallow copy register value p1 -> p2.
+        state.registers[instruction.p2] = state.registers[instruction.p1]
+        return pc + 1
+
+    def _op_OpenWrite(self, instruction: Instruction, pc: int, state: State) -> int:
+        # Open btree with write cursor (Currently cursors don't have read/write flag)
+        # TODO: Also p4 is unimplemeneted.
+        root_page_number = state.registers[instruction.p2]
+        state.btrees[instruction.p1] = BTree(self.pager, root_page_number)
+        return pc + 1
+
+    def _op_OpenRead(self, instruction: Instruction, pc: int, state: State) -> int:
+        # Open a cursor with root page p2 and assign its refname to val p1
+        root_page_number = state.registers[instruction.p2]
+        state.btrees[instruction.p1] = BTree(self.pager, root_page_number)
+        return pc + 1
+
+    def _op_String(self, instruction: Instruction, pc: int, state: State) -> int:
+        state.registers[instruction.p2] = instruction.p4
+        return pc + 1
+
+    def _op_Integer(self, instruction: Instruction, pc: int, state: State) -> int:
+        state.registers[instruction.p2] = instruction.p1
+        return pc + 1
+
+    def _op_Noop(self, instruction: Instruction, pc: int, state: State) -> int:
+        return pc + 1
+
+    def _op_Rewind(self, instruction: Instruction, pc: int, state: State) -> int:
+        # If table or index is empty jump to p2
+        # else rewind the btree cursor to start.
+        tree = cast(BTree, state.btrees[instruction.p1])
+
+        if tree.is_empty():
+            return cast(int, instruction.p2)
+
+        tree.reset()
+        return pc + 1
+
+    def _op_SeekRowid(self, instruction: Instruction, pc: int, state: State) -> int:
+        # Move cursor p1 to the row with row id r[p3] by descending the btree,
+        # jump to p2 if there isn't one.
+        tree = cast(BTree, state.btrees[instruction.p1])
+        record = tree.find(state.registers[instruction.p3])
+
+        if record is None:
+            return cast(int, instruction.p2)
+
+        tree.record = record
+        return pc + 1
+
+    def _op_Key(self, instruction: Instruction, pc: int, state: State) -> int:
+        # Read the key of the current row and store in register p2
+        row = cast(BTree, state.btrees[instruction.p1]).current()
+        state.registers[instruction.p2] = row.row_id
+        return pc + 1
+
+    def _op_Column(self, instruction: Instruction, pc: int, state: State) -> int:
+        # Read column at index p2 and store in register p3
+        row = cast(BTree, state.btrees[instruction.p1]).current()
+        state.registers[instruction.p3] = row.values[instruction.p2][1]
+        return pc + 1
+
+    def _op_ColumnRange(self, instruction: Instruction, pc: int, state: State) -> int:
+        # Copy p4 columns starting at p2 into the registers starting at p3.
+        values = cast(BTree, state.btrees[instruction.p1]).current().values
+        p2 = instruction.p2
+        p3 = instruction.p3
+        p4 = cast(int, instruction.p4)
+        state.registers[p3 : p3 + p4] = [value for _, value in values[p2 : p2 + p4]]
+        return pc + 1
+
+    def _op_MakeRecord(self, instruction: Instruction, pc: int, state: State) -> int:
+        registers = state.registers
+        base = instruction.p1
+        affinities = instruction.p4
+
+        if affinities is not None:
+            # p4 has the column types, build the record with the function
+            # generated for them rather than inferring each one.
+            registers[instruction.p3] = record_builder(affinities)(registers, base)
+            return pc + 1
+
+        # Looking the type up skips infer's isinstance checks for the common types.
+        value_type = VALUE_TYPES.get
+        infer = DataType.infer
+        registers[instruction.p3] = [
+            [value_type(type(v)) or infer(v), v]
+            for v in registers[base : base + instruction.p2]
+        ]
+        return pc + 1
+
+    def _op_ResultRow(self, instruction: Instruction, pc: int, state: State) -> int:
+        # Take all the stored values in registers p1 - p2 and hand them
+        # to the execute loop to yield to the caller.
+        state.row = state.registers[instruction.p1 : instruction.p2 + 1]
+        return pc + 1
+
+    def _op_EmitRow(self, instruction: Instruction, pc: int, state: State) -> int:
+        # Fused Key, Column..., ResultRow: emit the columns in p4
+        # straight from the current row.
+        values = cast(BTree, state.btrees[instruction.p1]).current().values
+        state.row = [values[i][1] for i in cast(tuple, instruction.p4)]
+        return pc + 1
+
+    def _op_Insert(self, instruction: Instruction, pc: int, state: State) -> int:
+        registers = state.registers
+        record_addr = instruction.p2
+        key_with_values = [
+            [DataType.integer, registers[instruction.p3]],
+            *registers[record_addr],
+        ]
+
+        record = Record(key_with_values)
+
+        cast(BTree, state.btrees[instruction.p1]).insert(record)
+        registers[record_addr] = record
+        return pc + 1
+
+    def _op_BulkInsert(self, instruction: Instruction, pc: int, state: State) -> int:
+        # p4 holds every row of the insert, p2 is the primary key index.
+        tree = cast(BTree, state.btrees[instruction.p1])
+        pk_index = instruction.p2
+        value_type = VALUE_TYPES.get
+        infer = DataType.infer
+
+        for row in cast(tuple, instruction.p4):
+            key_with_values = [
+                [DataType.integer, row[pk_index]],
+                *[[value_type(type(v)) or infer(v), v] for v in row],
+            ]
+            tree.insert(Record(key_with_values))
+
+        return pc + 1
+
+    def _op_Next(self, instruction: Instruction, pc: int, state: State) -> int:
+        # Jump back to p2 while there are rows left.
+        if cast(BTree, state.btrees[instruction.p1]).advance() is None:
+            return pc + 1
+
+        return cast(int, instruction.p2)
+
+    def _op_Close(self, instruction: Instruction, pc: int, state: State) -> int:
+        state.btrees[instruction.p1] = None
+        return pc + 1
+
+    def _op_Halt(self, instruction: Instruction, pc: int, state: State) -> int:
+        if instruction.p1 != 0:
+            # We have an error
+            raise Exception(instruction.p4)
+
+        return HALT
+
+
+VM.DISPATCH = VM.build_dispatch()